@@ -1,11 +1,12 @@
+import math
 from datetime import date, datetime, time, timedelta
-from typing import List, Optional, Callable
+from typing import Callable, Dict, List, Optional
 
 import plotly.graph_objects as go
 from colour import Color
 
-from input_reading import BusLeg
-from others import Employee
+from data import BusLeg
+from employee import Employee
 
 
 
@@ -100,9 +101,23 @@ class IntervalVisualizer:
         else:
             return Color('white')
 
+    @staticmethod
+    def downsample(intervals: List[Employee], max_rows: Optional[int]) -> List[Employee]:
+        """Return at most max_rows sequences, evenly spread over the given ones (all of them if max_rows is None).
+
+        :raise ValueError: if max_rows is smaller than 1
+        """
+        if max_rows is not None and max_rows < 1:
+            raise ValueError(f'max_rows must be at least 1, not {max_rows}')
+        if max_rows is None or len(intervals) <= max_rows:
+            return list(intervals)
+        step = math.ceil(len(intervals) / max_rows)
+        return list(intervals[::step])
+
     def create(self, intervals: List[Employee], title: str, type_attr: Optional[str] = None,
                hovertext: Callable[[BusLeg], str] = lambda x: None, text_attr: Optional[str] = None,
-               hidden: Optional[List[str]] = None) -> go.Figure:
+               hidden: Optional[List[str]] = None, aggregate: bool = False, max_rows: Optional[int] = None) -> \
+            go.Figure:
         """Create the figure for the given interval sequences.
 
         :param intervals: List of sequences, each sequence corresponds to one row with the attribute 'name' on the axis
@@ -114,11 +129,18 @@ class IntervalVisualizer:
         self.axis, no hover text if None is returned
         :param text_attr: BusLeg attribute to show as text in the center of each interval, formatted like hovertext
         :param hidden: List of types that are initially hidden
+        :param aggregate: Draw all the intervals of a type in a single trace (None-separated polygons), instead of one
+        trace per interval, for plans with thousands of intervals
+        :param max_rows: Maximum number of rows, larger plans are downsampled to every k-th sequence
         """
 
         types = {}
         if hidden is None:
             hidden = []
+        shown = self.downsample(intervals, max_rows)
+        if len(shown) < len(intervals):
+            title = f'{title} ({len(shown)} of {len(intervals)} rows)'
+        intervals = shown
 
         for i, sequence in enumerate(intervals):
             for interval in sequence:
@@ -143,8 +165,35 @@ class IntervalVisualizer:
                                                    self.__build_hover(interval, hovertext(interval)),
                                                    text))
 
+        if aggregate:
+            data = self.__aggregated_traces(types, hidden)
+        else:
+            data = self.__interval_traces(types, hidden)
+
+        fig = go.Figure(
+            data=data,
+            layout=go.Layout(
+                hoverdistance=3,
+                title=go.layout.Title(text=title),
+                xaxis=go.layout.XAxis(showspikes=True, spikedash='solid', spikemode='across', spikethickness=1),
+                yaxis=go.layout.YAxis(
+                    autorange='reversed',
+                    ticktext=list(map(lambda v: v.name, intervals)),
+                    tickvals=list(range(len(intervals))),
+                    zeroline=False
+                )
+            )
+        )
+
+        if self.axis_format is not None:
+            fig.update_xaxes(tickformat=self.axis_format)
+
+        return fig
+
+    def __interval_traces(self, types: Dict[Optional[str], List[VisualInterval]], hidden: List[str]) -> \
+            List[go.Scatter]:
+        """Return one trace per interval, and a text trace per type."""
         data = []
-        count = 0
         for t, values in types.items():
             text = []
             text_x = []
@@ -176,24 +225,51 @@ class IntervalVisualizer:
                     text_y.append(interval.pos)
             data.append(go.Scatter(hoverinfo='skip', legendgroup=t, mode='text', showlegend=False, text=text,
                                    textfont=dict(color=text_col.hex), x=text_x, y=text_y))
-            count += 1
+        return data
 
-        fig = go.Figure(
-            data=data,
-            layout=go.Layout(
-                hoverdistance=3,
-                title=go.layout.Title(text=title),
-                xaxis=go.layout.XAxis(showspikes=True, spikedash='solid', spikemode='across', spikethickness=1),
-                yaxis=go.layout.YAxis(
-                    autorange='reversed',
-                    ticktext=list(map(lambda v: v.name, intervals)),
-                    tickvals=list(range(len(intervals))),
-                    zeroline=False
-                )
-            )
-        )
+    def __aggregated_traces(self, types: Dict[Optional[str], List[VisualInterval]], hidden: List[str]) -> \
+            List[go.Scatter]:
+        """Return at most three traces per type: the filled intervals as None-separated polygons, the texts, and
+        invisible markers in the center of the intervals carrying the hover texts."""
+        data = []
+        for t, values in types.items():
+            col = Color(pick_for=t, pick_key=None)
+            text_col = self.__contrast_color(col)
+            visible = 'legendonly' if t in hidden else True
+            x, y = [], []
+            text, text_x, text_y = [], [], []
+            hover, hover_x, hover_y = [], [], []
+            for interval in values:
+                low = interval.pos - self.height
+                high = interval.pos + self.height
+                x += [interval.start, interval.end, interval.end, interval.start, interval.start, None]
+                y += [low, low, high, high, low, None]
+                center = interval.start + (interval.end - interval.start) / 2
+                if interval.text is not None:
+                    text.append(interval.text)
+                    text_x.append(center)
+                    text_y.append(interval.pos)
+                if interval.hover is not None:
+                    hover.append(interval.hover)
+                    hover_x.append(center)
+                    hover_y.append(interval.pos)
+            data.append(go.Scatter(fill='toself', hoverinfo='skip', legendgroup=t, line=dict(color=col.hex),
+                                   mode='lines', name=t, visible=visible, x=x, y=y))
+            if text:
+                data.append(go.Scatter(hoverinfo='skip', legendgroup=t, mode='text', showlegend=False, text=text,
+                                       textfont=dict(color=text_col.hex), visible=visible, x=text_x, y=text_y))
+            if hover:
+                data.append(go.Scatter(hoverinfo='text',
+                                       hoverlabel=go.scatter.Hoverlabel(bgcolor=col.hex, font=dict(color=text_col.hex)),
+                                       hovertext=hover, legendgroup=t, marker=dict(color=col.hex, opacity=0, size=12),
+                                       mode='markers', showlegend=False, visible=visible, x=hover_x, y=hover_y))
+        return data
 
-        if self.axis_format is not None:
-            fig.update_xaxes(tickformat=self.axis_format)
+    @staticmethod
+    def write_html(fig: go.Figure, path: str, include_plotlyjs='cdn') -> None:
+        """Export the figure as a static HTML file.
 
-        return fig
+        The figure is already validated when it is created, so the validation is skipped, and plotly.js is loaded from
+        the CDN by default instead of being embedded (about 3 MB per file), use include_plotlyjs=True for offline files.
+        """
+        fig.write_html(path, include_plotlyjs=include_plotlyjs, validate=False, auto_open=False)
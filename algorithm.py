@@ -1,35 +1,73 @@
-import csv
-import os
-import numpy as np
+import math
+import random
 import time
 from copy import deepcopy
 from sortedcontainers import SortedList
 
-import config as conf
 from data import Instance, BusLeg
-from typing import List
+from typing import Callable, Dict, List
 from employee import Employee
-from solution import Solution
+from solution import Solution, zobrist_key
+from neighborhood import Neighborhood, RelocateNeighborhood, RelocateMove
+from tabu import TabuMemory, LegEmployeeAttribute, VisitedSolutions
+from columns import Column, ColumnPool
 
 
 class Algorithm:
     def __init__(self, instance: Instance) -> None:
         self.instance = instance
+        self.config = instance.config
 
-    def exhaustive_search(self, sol: Solution):
-        """ Perform an exhaustive search in the neighborhood defined by assigning one leg to an other employee """
-        best_solution = Solution(sol.employees)
-        best_evaluation = sol.value
-        n = len(sol.employees)
-        for i in range(n-1):
-            for leg in sol.employees[i].bus_legs:
-                for j in range(i+1, n):
-                    new_evaluation = sol.perform_swap(i, j, leg)
-                    if new_evaluation < best_evaluation:
-                        best_evaluation = new_evaluation
-                        best_solution = sol.copy()
-                    sol.revert_swap(i, j, leg)
-        return best_solution, best_evaluation
+    def make_random(self, seed: int = None) -> random.Random:
+        """ Return the random number generator of the algorithm, seeded by 'seed' if given,
+            else by the stream of the algorithm class derived from the seed of the run (config.seed)
+        """
+        return random.Random(self.config.derive_seed(type(self).__name__) if seed is None else seed)
+
+    def insertion_cost(self, employee: Employee, leg: BusLeg) -> float:
+        """ Return the change of the objective of 'employee' if 'leg' is assigned to it. The employee is left unchanged. """
+        employee.bus_legs.add(leg)
+        cost = employee.evaluate() - employee.previous_objective
+        employee.bus_legs.remove(leg)
+        employee.revert()
+        return cost
+
+    def best_insertion(self, solution: Solution, i: int, leg: BusLeg) -> int:
+        """ Return the non empty employee, other than i, with the cheapest insertion of 'leg'.
+        The insertion is only evaluated if its lower bound can beat the best one.
+        """
+        best_cost = None
+        best_key = None
+        for key, employee in solution.employees.items():
+            if key == i or not employee.bus_legs:
+                continue
+            if best_cost is not None and employee.lower_bound([leg], []) - employee.objective >= best_cost:
+                continue
+            cost = self.insertion_cost(employee, leg)
+            if best_cost is None or cost < best_cost:
+                best_cost = cost
+                best_key = key
+        return best_key
+
+    def restricted_search(self, solution: Solution, selected: List[Employee], max_iter: int) -> None:
+        """ Improve the 'selected' employees of the solution with a tabu search restricted to their legs.
+            The other employees are unchanged, only the selected ones are evaluated again.
+        """
+        legs = SortedList(leg for e in selected for leg in e.bus_legs)
+        instance = Instance(legs, self.instance.distance_matrix, self.instance.start_work, self.instance.end_work,
+                            self.config)
+        employees = []
+        for e in selected:
+            employee = Employee(len(employees) + 1, instance)
+            employee.bus_legs = e.bus_legs.copy()
+            employees.append(employee)
+        sub_solution = Solution(employees)
+        sub_solution.evaluate(instance)
+        best_objective, best_solution = TabuSearch(instance, max_iter=max_iter).apply(sub_solution)
+        for e, repaired in zip(selected, best_solution.employees.values()):
+            e.bus_legs = repaired.bus_legs.copy()
+            solution.reevaluate(e.id)
+        solution.hash = solution.compute_hash()
 
 
             # def best_employee(self, leg: BusLeg, employees: Employee) -> Employee:
@@ -37,79 +75,253 @@ class Algorithm:
     
 
 class TabuSearch(Algorithm):
+    def __init__(self, instance: Instance, neighborhoods: List[Neighborhood] = None, max_iter: int = None,
+                 memory: TabuMemory = None, visited_capacity: int = 10000, cycle_limit: int = 3, kick: int = 3,
+                 seed: int = None, pruning: bool = True, lexicographic: bool = False,
+                 pool: ColumnPool = None, callback: Callable = None, reactive: bool = False,
+                 min_tenure: int = 1, max_tenure: int = None, increase: float = 1.2, decrease: float = 0.9,
+                 max_time: float = None) -> None:
+        """
+        :param neighborhoods:    Neighborhoods explored at every iteration (relocation of one leg by default)
+        :param max_iter:         Maximum number of iterations (config.max_iter by default)
+        :param max_time:         Maximum running time in seconds (no limit by default)
+        :param memory:           Tabu memory (leg -> employee attributes with tenure config.tabu_length by default)
+        :param visited_capacity: Number of visited solutions remembered, moves to them are skipped (0 disables it)
+        :param cycle_limit:      Number of revisited solutions before a diversification
+        :param kick:             Number of random moves of a diversification
+        :param seed:             Seed of the random number generator used by the diversification
+        :param pruning:          Skip the moves whose lower bound cannot beat the best move of the iteration
+        :param lexicographic:    Compare (hard, soft) lexicographically instead of hard + soft. Once a feasible
+                                 solution is reached, only the moves keeping it feasible are considered.
+        :param pool:             Column pool collecting the feasible shifts of the evaluated moves
+        :param callback:         Called after every iteration with (iteration, current objective, best objective),
+                                 the search stops if it returns True
+        :param reactive:         Adapt the tabu tenure: the visited solutions are no longer skipped but detect the
+                                 repetitions, which multiply the tenure by 'increase'. An improving iteration
+                                 more than 'tenure' iterations after the last repetition multiplies it by 'decrease'.
+        :param min_tenure:       Minimum reactive tenure
+        :param max_tenure:       Maximum reactive tenure (half the number of legs by default)
+        :param increase:         Factor applied to the tenure on a repetition (it grows by 1 at least)
+        :param decrease:         Factor applied to the tenure on a stable improvement (it shrinks by 1 at least)
+        """
+        super().__init__(instance)
+        if neighborhoods is None:
+            neighborhoods = [RelocateNeighborhood()]
+        if memory is None:
+            memory = TabuMemory([LegEmployeeAttribute()], self.config.tabu_length)
+        self.neighborhoods = neighborhoods
+        self.max_iter = self.config.max_iter if max_iter is None else max_iter
+        self.max_time = max_time
+        self.memory = memory
+        self.visited = VisitedSolutions(visited_capacity) if visited_capacity > 0 else None
+        self.cycle_limit = cycle_limit
+        self.kick = kick
+        self.random = self.make_random(seed)
+        self.pruning = pruning
+        self.lexicographic = lexicographic
+        self.pool = pool
+        self.callback = callback
+        if reactive and visited_capacity <= 0:
+            raise ValueError('The reactive tenure needs the visited solutions (visited_capacity > 0)')
+        self.reactive = reactive
+        self.initial_tenure = memory.tenure
+        self.min_tenure = min_tenure
+        self.max_tenure = max(memory.tenure, len(instance.legs) // 2) if max_tenure is None else max_tenure
+        self.increase = increase
+        self.decrease = decrease
+        self.tenure_history = []
+        self.last_repetition = 0
+        self.feasible_iter = None
+        self.cycles = 0
+        self.skipped = 0
+        self.pruned = 0
+        self.evaluated = 0
+
     def apply(self, current_solution:Solution):
         print('\n*******************************')
         print('*   TABU SEARCH (EXHAUSTIVE)  *')
         print('*******************************')
         best_solution = deepcopy(current_solution)
         # best_solution = sol.copy()
-        best_objective = current_solution.value
+        best_objective = self.objective(current_solution)
         # current_solution = sol.copy()
         # current_solution = deepcopy(sol)
-        number_of_employees = len(current_solution.employees)
-        number_of_bus_legs = len(self.instance.legs)
-        # tabu_list = np.zeros(shape=(number_of_employees, number_of_bus_legs))
-        tabu_list = [[-conf.TABU_LENGTH for i in range(number_of_bus_legs)] for j in range(number_of_employees)] 
+        memory = self.memory
+        memory.reset()
+        if self.reactive:
+            memory.tenure = self.initial_tenure
+        self.tenure_history = [(0, memory.tenure)]
+        self.last_repetition = 0
+        visited = self.visited
+        if visited is not None:
+            visited.clear()
+            visited.add(current_solution.hash)
+        self.cycles = 0
+        self.skipped = 0
+        self.pruned = 0
+        self.evaluated = 0
+        self.feasible_iter = None
+        revisits = 0
         start_time = time.time()
-        best_T_overall = 10**(20)
-        best_NT_overall = 10**(20)
+        worst = (10**(20), 10**(20)) if self.lexicographic else 10**(20)
+        best_T_overall = worst
+        best_NT_overall = worst
         iter = 1
-        while self.stopping_criteria(iter) is True:
-            best_NT_objective = 10**(20)
-            best_T_objective = 10**(20)
-            best_tabu_move = []
-            best_nontabu_move = []
-            for i, employee_1 in current_solution.employees.items():
-                for leg in employee_1.bus_legs:
-                    for j, employee_2 in current_solution.employees.items():
-                        if employee_1 == employee_2:
+        while self.stopping_criteria(iter, time.time() - start_time) is True:
+            best_NT_score = worst
+            best_NT_objective = worst
+            best_T_objective = worst
+            best_tabu_move = None
+            best_nontabu_move = None
+            current_objective = self.objective(current_solution)
+            # Lexicographic mode: once feasible, only feasible moves are considered
+            feasible_phase = self.lexicographic and current_solution.hard == 0
+            if feasible_phase and self.feasible_iter is None:
+                self.feasible_iter = iter
+                print(f'Feasible solution at iteration {iter}')
+            skipped = self.skipped
+            for neighborhood in self.neighborhoods:
+                for move in neighborhood.moves(current_solution):
+                    if (visited is not None and not self.reactive
+                            and current_solution.hash ^ move.hash_delta() in visited):
+                        self.skipped += 1
+                        continue
+                    # A tabu move is only useful if it improves the best solution, unless every move is tabu
+                    threshold = None
+                    if self.pruning and best_nontabu_move is not None and (feasible_phase or not self.lexicographic):
+                        threshold = max(best_NT_score, min(best_T_objective, best_objective))
+                        if feasible_phase:
+                            # hard = 0, so the value is the soft objective
+                            threshold = threshold[1]
+                        if move.lower_bound(current_solution) >= threshold:
+                            self.pruned += 1
                             continue
-                        move = [i, j, leg, iter]
-                        current_eval = current_solution.execute_move(i, j, leg)
-                        if iter - tabu_list[j-1][leg.id - 1] > conf.TABU_LENGTH:
-                            if current_eval < best_NT_objective:
-                                best_NT_objective = current_eval
-                                best_NT_overall = min(best_NT_overall, best_NT_objective)
-                                best_nontabu_move = move.copy()
-                        else:
-                            if current_eval < best_T_objective:
-                                best_T_objective = current_eval
-                                best_T_overall = min(best_T_overall, best_T_objective)
-                                best_tabu_move = move.copy()    
-                        current_eval = current_solution.revert(i, j, leg)
-            if best_T_objective < min(best_NT_objective, best_objective):
+                    self.evaluated += 1
+                    # With a threshold, the evaluation stops early if the move cannot be chosen
+                    move.execute(current_solution, threshold)
+                    if self.pool is not None:
+                        self.pool.add(current_solution.employees[move.i])
+                        self.pool.add(current_solution.employees[move.j])
+                    if feasible_phase and current_solution.hard > 0:
+                        move.revert(current_solution)
+                        continue
+                    current_eval = self.objective(current_solution)
+                    if not memory.is_tabu(move, current_solution, iter):
+                        score = current_eval
+                        if current_eval >= current_objective:
+                            score = self.penalize(score, memory.penalty(move))
+                        if score < best_NT_score:
+                            best_NT_score = score
+                            best_NT_objective = current_eval
+                            best_NT_overall = min(best_NT_overall, best_NT_objective)
+                            best_nontabu_move = move
+                    else:
+                        if current_eval < best_T_objective:
+                            best_T_objective = current_eval
+                            best_T_overall = min(best_T_overall, best_T_objective)
+                            best_tabu_move = move
+                    current_eval = move.revert(current_solution)
+            if best_tabu_move is None and best_nontabu_move is None:
+                if visited is None or self.skipped == skipped:
+                    break
+                # Every neighbor was visited recently: the search is trapped in a cycle
+                self.cycles += 1
+                self.diversify(current_solution, memory, iter)
+                visited.add(current_solution.hash)
+                iter += 1
+                continue
+            # Aspiration: a tabu move improving the best solution, or the best tabu move if every move is tabu
+            if (memory.aspiration(best_T_objective, min(best_NT_objective, best_objective))
+                    or best_nontabu_move is None):
                 best_T_overall = min(best_T_overall, best_T_objective)
-                tabu_list[best_tabu_move[0]-1][best_tabu_move[2].id-1] = best_tabu_move[-1]
-                current_eval = current_solution.execute_move(best_tabu_move[0], best_tabu_move[1], best_tabu_move[2])
+                memory.add(best_tabu_move, current_solution, iter)
+                current_eval = best_tabu_move.execute(current_solution)
+                memory.visit(best_tabu_move, current_solution)
                 if best_T_objective < best_objective:
                     best_solution = deepcopy(current_solution)
                     best_objective = best_T_objective
                     print(f'Best Solution (Tabu)= {best_objective}')
-            else:                
+            else:
                 # Update Tabu List
-                tabu_list[best_nontabu_move[0]-1][best_nontabu_move[2].id-1] = best_nontabu_move[-1]
-                current_eval = current_solution.execute_move(best_nontabu_move[0], best_nontabu_move[1], best_nontabu_move[2])
+                memory.add(best_nontabu_move, current_solution, iter)
+                current_eval = best_nontabu_move.execute(current_solution)
+                memory.visit(best_nontabu_move, current_solution)
                 if best_NT_objective < best_objective:
                     best_solution = deepcopy(current_solution)
                     best_objective = best_NT_objective
                     print(f'Best Solution (NonTabu) = {best_objective}')
+            repeated = visited is not None and visited.add(current_solution.hash)
+            if self.reactive:
+                self.react(iter, repeated, self.objective(current_solution) < current_objective)
+            if repeated:
+                self.cycles += 1
+                revisits += 1
+                if revisits >= self.cycle_limit:
+                    revisits = 0
+                    self.diversify(current_solution, memory, iter)
+                    if self.objective(current_solution) < best_objective:
+                        best_solution = deepcopy(current_solution)
+                        best_objective = self.objective(current_solution)
+                    visited.add(current_solution.hash)
+            if self.callback is not None and self.callback(iter, self.objective(current_solution), best_objective):
+                break
             iter += 1
-            CPU_time = time.time() - start_time
         print()
         print(f'Best Tabu objective = {best_T_overall}')
         print(f'Best NonTabu objective =', best_NT_overall)
+        if visited is not None:
+            print(f'Cycles = {self.cycles}, skipped moves = {self.skipped}')
+        print(f'Evaluated moves = {self.evaluated}, pruned moves = {self.pruned}')
+        if self.reactive:
+            tenures = [tenure for iteration, tenure in self.tenure_history]
+            print(f'Tenure = {tenures[-1]} (min {min(tenures)}, max {max(tenures)}, '
+                  f'{len(tenures) - 1} changes)')
         print()
-        return best_objective, best_solution 
-
-    def stopping_criteria(self, iteration):
-        """ 1 for max number of iterations,
-            2 for CPU time """
-        criteria = 1
-        if criteria is 1:
-            if iteration < conf.MAX_ITER:
-                return True
-            else:
-                return False
+        return best_solution.value, best_solution 
+
+    def react(self, iteration: int, repeated: bool, improved: bool) -> None:
+        """ Update the reactive tenure after the move of an iteration, and record it in tenure_history """
+        tenure = self.memory.tenure
+        if repeated:
+            tenure = min(self.max_tenure, max(tenure + 1, round(tenure * self.increase)))
+            self.last_repetition = iteration
+        elif improved and iteration - self.last_repetition > tenure:
+            tenure = max(self.min_tenure, min(tenure - 1, round(tenure * self.decrease)))
+        if tenure != self.memory.tenure:
+            self.memory.tenure = tenure
+            self.tenure_history.append((iteration, tenure))
+
+    def objective(self, solution: Solution):
+        """ Return the value compared by the search: (hard, soft) in lexicographic mode, hard + soft otherwise """
+        if self.lexicographic:
+            return solution.multi_value
+        return solution.value
+
+    def penalize(self, objective, penalty: float):
+        """ Add the diversification penalty to an objective (to the soft part in lexicographic mode) """
+        if self.lexicographic:
+            return objective[0], objective[1] + penalty
+        return objective + penalty
+
+    def diversify(self, solution: Solution, memory: TabuMemory, iteration: int) -> None:
+        """ Execute 'kick' random relocations of one leg, making them tabu """
+        keys = [key for key, e in solution.employees.items() if e.bus_legs]
+        for _ in range(self.kick):
+            if not keys:
+                return
+            i = self.random.choice(keys)
+            j = self.random.choice(list(solution.employees.keys()))
+            bus_legs = solution.employees[i].bus_legs
+            if i == j or not bus_legs:
+                continue
+            move = RelocateMove(i, j, bus_legs[self.random.randrange(len(bus_legs))])
+            memory.add(move, solution, iteration)
+            move.execute(solution)
+            memory.visit(move, solution)
+
+    def stopping_criteria(self, iteration, elapsed: float = 0):
+        """ Continue while the number of iterations is below max_iter and the running time below max_time (if any) """
+        return iteration < self.max_iter and (self.max_time is None or elapsed < self.max_time)
                     
                     
 
@@ -117,15 +329,30 @@ class TabuSearch(Algorithm):
 
 
 class ConstructionAlgorithm(Algorithm):
-
+    def __init__(self, instance: Instance, lexicographic: bool = False, alpha: float = 0,
+                 seed: int = None) -> None:
+        """
+        :param lexicographic: Choose the employee of a leg comparing (hard, soft) lexicographically
+        :param alpha:         Randomized greedy (GRASP): the employee of a leg is chosen at random in a
+                              restricted candidate list of cheap insertions (see restricted_candidate).
+                              0 always chooses the employee with the best objective.
+        :param seed:          Seed of the random number generator used when alpha > 0
+        """
+        super().__init__(instance)
+        self.lexicographic = lexicographic
+        self.alpha = alpha
+        self.random = self.make_random(seed)
 
     def apply(self):
         legs_unassigned = self.instance.legs.copy()
-        temporaryEmployees = [Employee(i + 1, self.instance) for i in range(len(legs_unassigned))]
+        # The last employee is always empty, a new one is created when it gets a leg
+        temporaryEmployees = [Employee(1, self.instance)]
 
         while len(legs_unassigned) > 0:
             leg = legs_unassigned[0]
             employee = self.bestEmployee(temporaryEmployees, leg)
+            if employee is temporaryEmployees[-1]:
+                temporaryEmployees.append(Employee(len(temporaryEmployees) + 1, self.instance))
             employee.bus_legs.add(leg)
             employee.evaluate()
             legs_unassigned.remove(leg)
@@ -135,11 +362,11 @@ class ConstructionAlgorithm(Algorithm):
                     break
                 employee.bus_legs.add(next_leg)
                 employee.evaluate()
-                if employee.state.MultiValue[0] == 0:
+                if employee.state.hard == 0:
                     legs_unassigned.remove(next_leg)
                 else:
                     employee.bus_legs.remove(next_leg)
-                    employee.evaluate
+                    employee.evaluate()
                     break
 
         #     while True:
@@ -160,31 +387,568 @@ class ConstructionAlgorithm(Algorithm):
         #             continue
         #         best_empl.assign_leg_to_employee(next_leg, times, change, ride, split, dc, start_fs, start_shift, end_ls, end_shift)
         #         legs_unassigned.remove(next_leg)    
-        k = 0
-        employees = []
-        while temporaryEmployees[k].state.total_time > 0:
-            employees.append(temporaryEmployees[k])
-            k += 1
+        employees = temporaryEmployees[:-1]
 
         solution = Solution(employees)
         return solution
 
     def bestEmployee(self, listOfEmployees: List[Employee], leg: BusLeg) -> Employee:
         """ return the employee with the lowerst objective in listOfEmployees for the leg 'leg'. """
-        best_objective = 999999999
+        best_objective = (999999999, 999999999) if self.lexicographic else 999999999
         best_key = -1
+        evaluations = []
+        empty_seen = False
         for key, employee in enumerate(listOfEmployees):
+            # Empty employees are all equivalent: only the first one is a candidate
+            if not employee.bus_legs:
+                if empty_seen:
+                    if self.alpha > 0:
+                        evaluations.append(None)
+                    continue
+                empty_seen = True
             employee.bus_legs.add(leg)
             evaluation = employee.evaluate()
+            if self.lexicographic:
+                evaluation = (employee.state.hard, employee.state.soft)
             if evaluation < best_objective:
                 best_key = key
                 best_objective = evaluation
+            if self.alpha > 0:
+                # The candidate list is built on the (hard, soft) insertion costs
+                evaluations.append((employee.state.hard - employee.previous_state.hard,
+                                    employee.state.soft - employee.previous_state.soft))
             employee.bus_legs.remove(leg)
             employee.objective = employee.evaluate()
+        if self.alpha > 0:
+            return listOfEmployees[self.restricted_candidate(evaluations)]
         return listOfEmployees[best_key]
 
+    def restricted_candidate(self, evaluations: List) -> int:
+        """ Return the index of a random employee of the restricted candidate list.
+        Only the employees with the lowest hard insertion cost are candidates, and
+        among them the ones with soft insertion cost <= best + alpha*(worst - best).
+        """
+        hard = min(e[0] for e in evaluations if e is not None)
+        values = [e[1] if e is not None and e[0] == hard else None for e in evaluations]
+        best = min(v for v in values if v is not None)
+        worst = max(v for v in values if v is not None)
+        threshold = best + self.alpha * (worst - best)
+        candidates = [key for key, v in enumerate(values) if v is not None and v <= threshold]
+        return self.random.choice(candidates)
+
 
     def next_tour_leg(self, legs_unassigned: list, input_leg: BusLeg) -> BusLeg:
         for leg in legs_unassigned:
             if (leg.tour == input_leg.tour):
-                return leg
\ No newline at end of file
+                return leg
+
+class ALNS(Algorithm):
+    """ Adaptive Large Neighborhood Search.
+
+    Every iteration removes some legs with a destroy operator and assigns them
+    again with a repair operator. Operators are picked by roulette wheel on
+    weights adapted to their past success, and the new solution is accepted
+    with the simulated annealing criterion. Only the employees touched by the
+    destroy and repair operators are evaluated again.
+    """
+
+    # Score of the operators when the new solution is a new best, improves the current one, or is accepted
+    SCORES = (33, 9, 13)
+
+    def __init__(self, instance: Instance, max_iter: int = None, max_time: float = None,
+                 min_destroy: float = 0.05, max_destroy: float = 0.2, reaction: float = 0.1,
+                 segment: int = 100, start_temperature: float = 0.05, cooling: float = 0.9995,
+                 seed: int = None) -> None:
+        """
+        :param max_iter:          Maximum number of iterations (config.alns_max_iter by default)
+        :param max_time:          Maximum running time in seconds (config.max_cputime by default)
+        :param min_destroy:       Minimum fraction of the legs removed by a destroy operator
+        :param max_destroy:       Maximum fraction of the legs removed by a destroy operator
+        :param reaction:          How fast the weights follow the scores of the last segment
+        :param segment:           Number of iterations between two updates of the weights
+        :param start_temperature: A solution this fraction worse than the initial one is accepted with probability 0.5
+        :param cooling:           Factor applied to the temperature at every iteration
+        :param seed:              Seed of the random number generator
+        """
+        super().__init__(instance)
+        self.max_iter = self.config.alns_max_iter if max_iter is None else max_iter
+        self.max_time = self.config.max_cputime if max_time is None else max_time
+        self.min_destroy = min_destroy
+        self.max_destroy = max_destroy
+        self.reaction = reaction
+        self.segment = segment
+        self.start_temperature = start_temperature
+        self.cooling = cooling
+        self.random = self.make_random(seed)
+        self.destroy_operators = [self.destroy_random, self.destroy_time_window,
+                                  self.destroy_worst_employees, self.destroy_related_tours]
+        self.repair_operators = [self.repair_greedy, self.repair_regret]
+        self.tours = {}
+        for leg in self.instance.legs:
+            self.tours.setdefault(leg.tour, []).append(leg)
+
+    def apply(self, current_solution: Solution):
+        print('\n*******************************')
+        print('*            ALNS             *')
+        print('*******************************')
+        best_solution = deepcopy(current_solution, {id(self.instance): self.instance})
+        best_objective = current_solution.value
+        destroy_weights = [1.0] * len(self.destroy_operators)
+        repair_weights = [1.0] * len(self.repair_operators)
+        destroy_scores = [0] * len(self.destroy_operators)
+        repair_scores = [0] * len(self.repair_operators)
+        destroy_uses = [0] * len(self.destroy_operators)
+        repair_uses = [0] * len(self.repair_operators)
+        temperature = max(1.0, -self.start_temperature * current_solution.value / math.log(0.5))
+        number_of_bus_legs = len(self.instance.legs)
+        min_removed = max(1, int(self.min_destroy * number_of_bus_legs))
+        max_removed = max(min_removed, int(self.max_destroy * number_of_bus_legs))
+        start_time = time.time()
+        iter = 1
+        while iter <= self.max_iter and time.time() - start_time < self.max_time:
+            d = self.random.choices(range(len(self.destroy_operators)), weights=destroy_weights)[0]
+            r = self.random.choices(range(len(self.repair_operators)), weights=repair_weights)[0]
+            old_objective = current_solution.value
+            old_hash = current_solution.hash
+            backup = {}
+            removed = self.destroy_operators[d](current_solution, self.random.randint(min_removed, max_removed))
+            self.remove_legs(current_solution, removed, backup)
+            self.repair_operators[r](current_solution, removed, backup)
+            new_objective = current_solution.value
+            score = 0
+            if new_objective < best_objective:
+                score = self.SCORES[0]
+                best_solution = deepcopy(current_solution, {id(self.instance): self.instance})
+                best_objective = new_objective
+                print(f'Best Solution (ALNS) = {best_objective}')
+            elif new_objective < old_objective:
+                score = self.SCORES[1]
+            elif self.random.random() < math.exp(-(new_objective - old_objective) / temperature):
+                if new_objective > old_objective:
+                    score = self.SCORES[2]
+            else:
+                self.restore(current_solution, backup, old_objective, old_hash)
+            destroy_scores[d] += score
+            repair_scores[r] += score
+            destroy_uses[d] += 1
+            repair_uses[r] += 1
+            if iter % self.segment == 0:
+                self.update_weights(destroy_weights, destroy_scores, destroy_uses)
+                self.update_weights(repair_weights, repair_scores, repair_uses)
+            temperature *= self.cooling
+            iter += 1
+        print()
+        print(f'Iterations = {iter - 1}')
+        print('Destroy weights =', {op.__name__: round(w, 2) for op, w in zip(self.destroy_operators, destroy_weights)})
+        print('Repair weights =', {op.__name__: round(w, 2) for op, w in zip(self.repair_operators, repair_weights)})
+        print()
+        return best_objective, best_solution
+
+    def update_weights(self, weights: List[float], scores: List[int], uses: List[int]) -> None:
+        for k in range(len(weights)):
+            if uses[k] > 0:
+                weights[k] = (1 - self.reaction) * weights[k] + self.reaction * scores[k] / uses[k]
+            scores[k] = 0
+            uses[k] = 0
+
+    # ------------------ #
+    # SOLUTION HANDLING  #
+    # ------------------ #
+
+    def touch(self, employee: Employee, backup: dict) -> None:
+        """ Store the employee in 'backup' before its first change in the current iteration """
+        if employee.id not in backup:
+            backup[employee.id] = (employee.bus_legs.copy(), employee.objective, employee.state, employee._blocks)
+
+    def restore(self, solution: Solution, backup: dict, value: float, h: int) -> None:
+        """ Undo the changes of the current iteration, using the employees stored in 'backup' """
+        solution.commit()
+        for key, stored in backup.items():
+            employee = solution.employees[key]
+            solution.account(employee, -1)
+            solution.count(employee.state, -1)
+            if stored is None:
+                del solution.employees[key]
+                continue
+            employee.bus_legs, employee.objective, employee.state, employee.blocks = stored
+            solution.account(employee, 1)
+            solution.count(employee.state, 1)
+        solution.value = value
+        solution.hash = h
+
+    def remove_legs(self, solution: Solution, legs: List[BusLeg], backup: dict) -> None:
+        owner = {}
+        for key, employee in solution.employees.items():
+            for leg in employee.bus_legs:
+                owner[leg.id] = key
+        changed = set()
+        for leg in legs:
+            employee = solution.employees[owner[leg.id]]
+            self.touch(employee, backup)
+            employee.bus_legs.remove(leg)
+            solution.hash ^= zobrist_key(leg.id, employee.id)
+            changed.add(employee.id)
+        for key in changed:
+            solution.reevaluate(key)
+
+    def empty_employee(self, solution: Solution, backup: dict) -> Employee:
+        """ Return an employee without legs, adding a new one to the solution if needed """
+        for employee in solution.employees.values():
+            if not employee.bus_legs:
+                return employee
+        employee = Employee(max(solution.employees.keys(), default=0) + 1, self.instance)
+        solution.employees[employee.id] = employee
+        backup[employee.id] = None
+        return employee
+
+    # ------------------ #
+    # DESTROY OPERATORS  #
+    # ------------------ #
+
+    def destroy_random(self, solution: Solution, q: int) -> List[BusLeg]:
+        """ Remove q random legs """
+        return self.random.sample(list(self.instance.legs), q)
+
+    def destroy_time_window(self, solution: Solution, q: int) -> List[BusLeg]:
+        """ Remove q legs consecutive in start time """
+        k = self.random.randrange(len(self.instance.legs) - q + 1)
+        return list(self.instance.legs[k:k+q])
+
+    def destroy_worst_employees(self, solution: Solution, q: int) -> List[BusLeg]:
+        """ Remove all the legs of the employees with the highest objective per leg, until q legs are removed """
+        employees = [e for e in solution.employees.values() if e.bus_legs]
+        employees.sort(key=lambda e: e.objective / len(e.bus_legs), reverse=True)
+        removed = []
+        while employees and len(removed) < q:
+            employee = employees.pop(int(len(employees) * self.random.random() ** 3))
+            removed.extend(employee.bus_legs)
+        return removed
+
+    def destroy_related_tours(self, solution: Solution, q: int) -> List[BusLeg]:
+        """ Remove whole tours close in time to the tour of a random leg, until q legs are removed """
+        seed_tour = self.tours[self.random.choice(self.instance.legs).tour]
+        start = seed_tour[0].start
+        end = seed_tour[-1].end
+        tours = sorted(self.tours.values(), key=lambda t: abs(t[0].start - start) + abs(t[-1].end - end))
+        removed = []
+        for tour in tours:
+            if len(removed) >= q:
+                break
+            removed.extend(tour)
+        return removed
+
+    # ----------------- #
+    # REPAIR OPERATORS  #
+    # ----------------- #
+
+    def repair_greedy(self, solution: Solution, legs: List[BusLeg], backup: dict) -> None:
+        """ Repeatedly insert the leg with the cheapest insertion """
+        self.repair(solution, legs, backup, regret=False)
+
+    def repair_regret(self, solution: Solution, legs: List[BusLeg], backup: dict) -> None:
+        """ Repeatedly insert the leg with the largest difference between its best and second best insertion """
+        self.repair(solution, legs, backup, regret=True)
+
+    def repair(self, solution: Solution, legs: List[BusLeg], backup: dict, regret: bool) -> None:
+        """ Insert 'legs' in the solution.
+        The insertion costs are computed once for every (leg, employee) pair,
+        then only the costs of the employee receiving a leg are updated.
+        """
+        empty = self.empty_employee(solution, backup)
+        employees = [e for e in solution.employees.values() if e.bus_legs] + [empty]
+        costs = {leg.id: {e.id: self.insertion_cost(e, leg) for e in employees} for leg in legs}
+        unassigned = list(legs)
+        while unassigned:
+            best_leg = None
+            best_key = None
+            best_value = None
+            for leg in unassigned:
+                ranking = sorted(costs[leg.id].items(), key=lambda item: item[1])
+                if regret:
+                    second = ranking[1][1] if len(ranking) > 1 else ranking[0][1]
+                    value = (ranking[0][1] - second, ranking[0][1])
+                else:
+                    value = (ranking[0][1],)
+                if best_value is None or value < best_value:
+                    best_leg = leg
+                    best_key = ranking[0][0]
+                    best_value = value
+            unassigned.remove(best_leg)
+            employee = solution.employees[best_key]
+            self.touch(employee, backup)
+            employee.bus_legs.add(best_leg)
+            solution.hash ^= zobrist_key(best_leg.id, employee.id)
+            solution.reevaluate(employee.id)
+            for leg in unassigned:
+                costs[leg.id][employee.id] = self.insertion_cost(employee, leg)
+            if employee is empty:
+                empty = self.empty_employee(solution, backup)
+                for leg in unassigned:
+                    costs[leg.id][empty.id] = self.insertion_cost(empty, leg)
+
+
+class SimulatedAnnealing(Algorithm):
+    """ Simulated annealing on randomly sampled moves [e_i, e_j, leg].
+
+    Every iteration executes one random move with Solution.execute_move, so it
+    costs two employee evaluations, and reverts it if it is rejected.
+    """
+
+    GEOMETRIC = 'geometric'
+    LINEAR = 'linear'
+    LUNDY_MEES = 'lundy_mees'
+
+    def __init__(self, instance: Instance, max_iter: int = None, max_time: float = None,
+                 start_temperature: float = None, final_temperature: float = 1.0,
+                 schedule: str = GEOMETRIC, alpha: float = 0.9995, reheat_after: int = None,
+                 reheat_ratio: float = 0.5, seed: int = None) -> None:
+        """
+        :param max_iter:          Maximum number of iterations (config.sa_max_iter by default)
+        :param max_time:          Maximum running time in seconds (config.max_cputime by default)
+        :param start_temperature: Initial temperature, estimated from random moves if None
+        :param final_temperature: Temperature reached at the end of the LINEAR and LUNDY_MEES schedules
+        :param schedule:          Cooling schedule: GEOMETRIC, LINEAR or LUNDY_MEES
+        :param alpha:             Factor applied to the temperature at every iteration by the GEOMETRIC schedule
+        :param reheat_after:      Number of iterations without a new best solution before reheating (never if None)
+        :param reheat_ratio:      After reheating, the temperature is at least this fraction of the initial one
+        :param seed:              Seed of the random number generator
+        """
+        super().__init__(instance)
+        if schedule not in (self.GEOMETRIC, self.LINEAR, self.LUNDY_MEES):
+            raise ValueError(f'Unknown cooling schedule {schedule}')
+        self.max_iter = self.config.sa_max_iter if max_iter is None else max_iter
+        self.max_time = self.config.max_cputime if max_time is None else max_time
+        self.start_temperature = start_temperature
+        self.final_temperature = final_temperature
+        self.schedule = schedule
+        self.alpha = alpha
+        self.reheat_after = reheat_after
+        self.reheat_ratio = reheat_ratio
+        self.random = self.make_random(seed)
+
+    def apply(self, current_solution: Solution):
+        print('\n*******************************')
+        print('*     SIMULATED ANNEALING     *')
+        print('*******************************')
+        best_solution = deepcopy(current_solution, {id(self.instance): self.instance})
+        best_objective = current_solution.value
+        keys = list(current_solution.employees.keys())
+        if len(keys) < 2:
+            return best_objective, best_solution
+        # Keys of the non empty employees, kept up to date when a move is accepted
+        busy = [key for key in keys if current_solution.employees[key].bus_legs]
+        start_temperature = self.start_temperature
+        if start_temperature is None:
+            start_temperature = self.initial_temperature(current_solution, keys, busy)
+        temperature = start_temperature
+        beta = (start_temperature - self.final_temperature) / \
+            (self.max_iter * start_temperature * self.final_temperature)
+        start_time = time.time()
+        last_improvement = 0
+        reheats = 0
+        iter = 1
+        while iter <= self.max_iter:
+            elapsed = time.time() - start_time
+            if elapsed >= self.max_time:
+                break
+            move = self.random_move(current_solution, keys, busy)
+            if move is None:
+                break
+            old_objective = current_solution.value
+            new_objective = current_solution.execute_move(*move)
+            delta = new_objective - old_objective
+            if delta > 0 and self.random.random() >= math.exp(-delta / temperature):
+                current_solution.revert(*move)
+            else:
+                i, j, leg = move
+                if not current_solution.employees[i].bus_legs:
+                    busy.remove(i)
+                if len(current_solution.employees[j].bus_legs) == 1:
+                    busy.append(j)
+                if new_objective < best_objective:
+                    best_solution = deepcopy(current_solution, {id(self.instance): self.instance})
+                    best_objective = new_objective
+                    last_improvement = iter
+            if self.schedule == self.GEOMETRIC:
+                temperature *= self.alpha
+            elif self.schedule == self.LINEAR:
+                progress = max(iter / self.max_iter, elapsed / self.max_time)
+                temperature = start_temperature - (start_temperature - self.final_temperature) * progress
+            else:
+                temperature = temperature / (1 + beta * temperature)
+            temperature = max(temperature, 1e-9)
+            if self.reheat_after is not None and iter - last_improvement >= self.reheat_after:
+                temperature = max(temperature, self.reheat_ratio * start_temperature)
+                last_improvement = iter
+                reheats += 1
+            iter += 1
+        print(f'Best Solution (SA) = {best_objective}')
+        print(f'Iterations = {iter - 1}, reheats = {reheats}')
+        print()
+        return best_objective, best_solution
+
+    def random_move(self, solution: Solution, keys: List[int], busy: List[int]):
+        """ Return a random move [i, j, leg], with a leg of employee i (among the non empty employees 'busy')
+            moved to employee j, None if every employee is empty
+        """
+        if not busy:
+            return None
+        i = self.random.choice(busy)
+        bus_legs = solution.employees[i].bus_legs
+        j = self.random.choice(keys)
+        while j == i:
+            j = self.random.choice(keys)
+        return i, j, bus_legs[self.random.randrange(len(bus_legs))]
+
+    def initial_temperature(self, solution: Solution, keys: List[int], busy: List[int], samples: int = 100) -> float:
+        """ Return the temperature accepting the median worsening random move with probability 0.5 """
+        deltas = []
+        for _ in range(samples):
+            move = self.random_move(solution, keys, busy)
+            if move is None:
+                break
+            old_objective = solution.value
+            delta = solution.execute_move(*move) - old_objective
+            solution.revert(*move)
+            if delta > 0:
+                deltas.append(delta)
+        if not deltas:
+            return self.final_temperature
+        deltas.sort()
+        return -deltas[len(deltas) // 2] / math.log(0.5)
+
+
+class FleetReduction(Algorithm):
+    """ Reduce the number of employees.
+
+    The employees with the fewest legs are tried first: each of their legs is
+    moved to the other employee with the cheapest insertion, and the employee
+    is removed if the evaluation improves, otherwise the legs are moved back.
+    Removed employees are dropped from the solution, so the neighborhoods
+    explored afterwards are smaller.
+    """
+
+    def __init__(self, instance: Instance, max_legs: int = None, passes: int = 2) -> None:
+        """
+        :param max_legs: Only the employees with at most max_legs legs are tried (all by default)
+        :param passes:   Maximum number of passes over the employees
+        """
+        super().__init__(instance)
+        self.max_legs = max_legs
+        self.passes = passes
+
+    def apply(self, current_solution: Solution):
+        print('\n*******************************')
+        print('*       FLEET REDUCTION       *')
+        print('*******************************')
+        number_of_employees = sum(1 for e in current_solution.employees.values() if e.bus_legs)
+        for _ in range(self.passes):
+            removed = 0
+            candidates = [e for e in current_solution.employees.values()
+                          if e.bus_legs and (self.max_legs is None or len(e.bus_legs) <= self.max_legs)]
+            candidates.sort(key=lambda e: (len(e.bus_legs), e.objective))
+            for employee in candidates:
+                if employee.bus_legs and self.empty(current_solution, employee.id):
+                    removed += 1
+            if removed == 0:
+                break
+        solution = current_solution.removeEmptyEmployees()
+        print(f'Employees: {number_of_employees} -> {len(solution.employees)}, value = {solution.value}')
+        print()
+        return solution.value, solution
+
+    def empty(self, solution: Solution, i: int) -> bool:
+        """ Try to move every leg of employee i to the other employees, keep the moves if the evaluation improves """
+        old_objective = solution.value
+        moves = []
+        for leg in list(solution.employees[i].bus_legs):
+            j = self.best_insertion(solution, i, leg)
+            if j is None:
+                break
+            solution.execute_move(i, j, leg)
+            moves.append((j, leg))
+        if not solution.employees[i].bus_legs and solution.value < old_objective:
+            return True
+        for j, leg in reversed(moves):
+            solution.execute_move(j, i, leg)
+        return False
+
+
+class SetPartitioning(Algorithm):
+    """ Build a solution from the columns of a pool, without an external solver.
+
+    Starting from the shifts of a solution, a column c of the pool replaces the
+    shifts S it intersects when every fragment s - c (s in S) is empty or is
+    itself a column of the pool, and
+        cost(c) + sum(cost(s - c)) < sum(cost(s))
+    The costs are known, so no employee is evaluated during the search.
+    """
+
+    def __init__(self, instance: Instance, pool: ColumnPool, max_passes: int = 10) -> None:
+        """
+        :param pool:       Column pool filled during the construction and the search
+        :param max_passes: Maximum number of passes over the columns, sorted by cost per leg
+        """
+        super().__init__(instance)
+        self.pool = pool
+        self.max_passes = max_passes
+
+    def apply(self, current_solution: Solution):
+        print('\n*******************************')
+        print('*      SET PARTITIONING       *')
+        print('*******************************')
+        chosen = {}
+        owner = {}
+        for employee in current_solution.employees.values():
+            if employee.bus_legs:
+                legs = tuple(leg.id for leg in employee.bus_legs)
+                chosen[legs] = Column(legs, employee.objective)
+                for leg_id in legs:
+                    owner[leg_id] = legs
+        value = sum(c.cost for c in chosen.values())
+        print(f'Columns = {len(self.pool)}, starting value = {value}')
+        candidates = sorted(self.pool.columns.values(), key=lambda c: c.cost_per_leg)
+        for _ in range(self.max_passes):
+            improved = False
+            for column in candidates:
+                if column.legs in chosen:
+                    continue
+                delta = self.replace(column, chosen, owner)
+                if delta < 0:
+                    value += delta
+                    improved = True
+            if not improved:
+                break
+        solution = Solution.construct_from_shifts(self.instance, [list(legs) for legs in chosen])
+        solution.evaluate(self.instance)
+        print(f'Recombined value = {solution.value}')
+        print()
+        return solution.value, solution
+
+    def replace(self, column: Column, chosen: Dict, owner: Dict) -> int:
+        """ Replace the shifts intersecting 'column' by it and their fragments, if it improves the value.
+
+        :return: the change of the value (0 if nothing is replaced)
+        """
+        intersected = {owner[leg_id] for leg_id in column.legs}
+        new_legs = set(column.legs)
+        fragments = []
+        delta = column.cost
+        for legs in intersected:
+            delta -= chosen[legs].cost
+            fragment = tuple(leg_id for leg_id in legs if leg_id not in new_legs)
+            if fragment:
+                fragment_column = self.pool.get(fragment)
+                if fragment_column is None:
+                    return 0
+                delta += fragment_column.cost
+                fragments.append(fragment_column)
+        if delta >= 0:
+            return 0
+        for legs in intersected:
+            del chosen[legs]
+        for c in [column] + fragments:
+            chosen[c.legs] = c
+            for leg_id in c.legs:
+                owner[leg_id] = c.legs
+        return delta
@@ -0,0 +1,63 @@
+from typing import Tuple
+
+from employee import Employee
+from solution import Solution
+
+
+class Column:
+    """ A shift: the ids of its legs (sorted as the legs of an employee) and its objective """
+
+    def __init__(self, legs: Tuple[int, ...], cost: int) -> None:
+        self.legs = legs
+        self.cost = cost
+
+    @property
+    def cost_per_leg(self) -> float:
+        return self.cost / len(self.legs)
+
+
+class ColumnPool:
+    """ Bounded pool of the distinct feasible shifts evaluated during construction and search.
+
+    The objective of a solution is the sum of the objectives of its employees,
+    so a solution can be built from the pool without evaluating anything.
+    When the pool exceeds its capacity by 10%, the columns with the highest
+    cost per leg are evicted.
+    """
+
+    def __init__(self, capacity: int = 100000) -> None:
+        self.capacity = capacity
+        self.columns = {}
+        self.added = 0
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def __contains__(self, legs: Tuple[int, ...]) -> bool:
+        return legs in self.columns
+
+    def get(self, legs: Tuple[int, ...]) -> Column:
+        return self.columns.get(legs)
+
+    def add(self, employee: Employee) -> None:
+        """ Add the shift of an evaluated employee, if it is feasible """
+        state = employee.state
+        if not employee.bus_legs or state.cut or state.hard > 0:
+            return
+        self.add_column(tuple(leg.id for leg in employee.bus_legs), employee.objective)
+
+    def add_column(self, legs: Tuple[int, ...], cost: int) -> None:
+        if legs in self.columns:
+            return
+        self.columns[legs] = Column(legs, cost)
+        self.added += 1
+        if len(self.columns) > self.capacity * 1.1:
+            self.evict()
+
+    def add_solution(self, solution: Solution) -> None:
+        for employee in solution.employees.values():
+            self.add(employee)
+
+    def evict(self) -> None:
+        kept = sorted(self.columns.values(), key=lambda c: c.cost_per_leg)[:self.capacity]
+        self.columns = {c.legs: c for c in kept}
@@ -1,4 +1,7 @@
+import hashlib
 import math
+import os
+import random
 
 # INSTANCE_SIZE = 3
 # INSTANCE_NUMBER = "0"
@@ -31,4 +34,129 @@ EMPLOYEE_T_MAX = 14*60
 
 MAX_ITER = 300
 MAX_CPUTIME = 600
-TABU_LENGTH = math.floor(math.sqrt(MAX_ITER))
\ No newline at end of file
+TABU_LENGTH = math.floor(math.sqrt(MAX_ITER))
+
+ALNS_MAX_ITER = 20*MAX_ITER
+SA_MAX_ITER = 1000*MAX_ITER
+
+
+class Config:
+    """ Parameters of one run.
+
+    Every instance carries its configuration (Instance.config), which is read
+    by the evaluation of the employees and by the algorithms, so runs with
+    different labor rules or budgets can share a process. The constants above
+    are the defaults, overridden by the environment (BDS_MAX_ITER=100) and by
+    the command line (--max-iter 100).
+
+    The seed of the run (BDS_SEED, --seed) makes it reproducible: every
+    algorithm and worker process draws its random numbers from a stream
+    derived from it (see derive_seed). Without a seed the runs are random.
+    """
+
+    PARAMETERS = {
+        'instance_size': str,
+        'instance_number': str,
+        'name': str,
+        'employee_d_max': int,
+        'employee_w_max': int,
+        'employee_w_min': int,
+        'employee_t_max': int,
+        'max_iter': int,
+        'max_cputime': float,
+        'tabu_length': int,
+        'alns_max_iter': int,
+        'sa_max_iter': int,
+        'seed': int,
+    }
+    ENV_PREFIX = 'BDS_'
+
+    def __init__(self, instance_size: str = INSTANCE_SIZE, instance_number: str = INSTANCE_NUMBER, name: str = NAME,
+                 employee_d_max: int = EMPLOYEE_D_MAX, employee_w_max: int = EMPLOYEE_W_MAX,
+                 employee_w_min: int = EMPLOYEE_W_MIN, employee_t_max: int = EMPLOYEE_T_MAX,
+                 max_iter: int = MAX_ITER, max_cputime: float = MAX_CPUTIME, tabu_length: int = None,
+                 alns_max_iter: int = None, sa_max_iter: int = None, seed: int = None) -> None:
+        """
+        The tabu tenure and the iterations of ALNS and simulated annealing
+        are derived from max_iter as the constants above, unless given.
+        """
+        self.instance_size = instance_size
+        self.instance_number = instance_number
+        self.name = name
+        self.employee_d_max = employee_d_max
+        self.employee_w_max = employee_w_max
+        self.employee_w_min = employee_w_min
+        self.employee_t_max = employee_t_max
+        self.max_iter = max_iter
+        self.max_cputime = max_cputime
+        self.tabu_length = math.floor(math.sqrt(max_iter)) if tabu_length is None else tabu_length
+        self.alns_max_iter = 20*max_iter if alns_max_iter is None else alns_max_iter
+        self.sa_max_iter = 1000*max_iter if sa_max_iter is None else sa_max_iter
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.PARAMETERS}
+
+    def replace(self, **changes) -> 'Config':
+        """ Return a copy with some parameters changed (the derived ones are not derived again) """
+        return Config(**{**self.as_dict(), **changes})
+
+    def derive_seed(self, *keys) -> int:
+        """ Return the seed of an independent random stream of the run, e.g. derive_seed('TabuSearch') or
+            derive_seed('subproblem', 3), None if the run has no seed.
+
+        It only depends on the seed of the run and on the keys, so a worker
+        process gets the same stream whatever the number of workers.
+        """
+        if self.seed is None:
+            return None
+        digest = hashlib.blake2b(repr((self.seed,) + keys).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+
+    def with_seed(self) -> 'Config':
+        """ Return the configuration, with a random seed if it has none, so that the run can be reproduced """
+        if self.seed is not None:
+            return self
+        return self.replace(seed=random.SystemRandom().getrandbits(32))
+
+    def __repr__(self) -> str:
+        return f'Config({", ".join(f"{k}={v!r}" for k, v in self.as_dict().items())})'
+
+    @staticmethod
+    def from_dict(parameters: dict) -> 'Config':
+        """ Build a configuration from the defaults and the given parameters only (not the environment)
+
+        :raise ValueError: for an unknown parameter or a value of the wrong type
+        """
+        unknown = sorted(set(parameters) - set(Config.PARAMETERS))
+        if unknown:
+            raise ValueError(f'Unknown parameters {", ".join(unknown)}')
+        values = {}
+        for name, value in parameters.items():
+            if value is not None:
+                try:
+                    values[name] = Config.PARAMETERS[name](value)
+                except (TypeError, ValueError):
+                    raise ValueError(f'Invalid value {value!r} of {name}') from None
+        return Config(**values)
+
+    @staticmethod
+    def from_env(environ: dict = None, **parameters) -> 'Config':
+        """ Build a configuration from the BDS_* environment variables, the given parameters take precedence """
+        environ = os.environ if environ is None else environ
+        for name, cast in Config.PARAMETERS.items():
+            key = Config.ENV_PREFIX + name.upper()
+            if parameters.get(name) is None and key in environ:
+                parameters[name] = cast(environ[key])
+        return Config(**{k: v for k, v in parameters.items() if v is not None})
+
+    @staticmethod
+    def add_arguments(parser) -> None:
+        """ Add an option for every parameter to an argparse parser """
+        for name, cast in Config.PARAMETERS.items():
+            parser.add_argument('--' + name.replace('_', '-'), dest=name, type=cast, default=None)
+
+    @staticmethod
+    def from_args(args, environ: dict = None) -> 'Config':
+        """ Build a configuration from parsed options, over the environment, over the defaults """
+        return Config.from_env(environ, **{name: getattr(args, name, None) for name in Config.PARAMETERS})
@@ -2,18 +2,26 @@ import csv
 import os
 from sortedcontainers import SortedList
 
+from config import Config
+
 class Instance:
-    def __init__(self, legs, distance_matrix, start_work, end_work) -> None:
+    def __init__(self, legs, distance_matrix, start_work, end_work, config: Config = None) -> None:
         self.legs = legs
         self.distance_matrix = distance_matrix
         self.start_work = start_work
         self.end_work = end_work
+        # Labor rules and budgets of the run, read by the evaluation and the algorithms
+        self.config = Config() if config is None else config
+
+    def __deepcopy__(self, memo):
+        # The instance is read-only input data, copies of a solution share it
+        return self
 
     @staticmethod
-    def read_data(size, number):
-        os.chdir(r'./busdriver_instances')
+    def read_data(size, number, directory='busdriver_instances', config: Config = None):
+        path = os.path.join(directory, f'realistic_{size}_{number}')
 
-        with open(f'realistic_{size}_{number}.csv') as csv_file:
+        with open(f'{path}.csv') as csv_file:
             csv_reader = csv.reader(csv_file, delimiter=',',
                                     quoting=csv.QUOTE_NONNUMERIC)
             bus_legs = SortedList()
@@ -24,12 +32,12 @@ class Instance:
                                        int(row[2]), int(row[3]), int(row[4])))
                 line_counter += 1
 
-        with open(f'realistic_{size}_{number}_dist.csv') as f:
+        with open(f'{path}_dist.csv') as f:
             csv_reader = csv.reader(f, delimiter=',',
                                     quoting=csv.QUOTE_NONNUMERIC)
             distance_matrix = list(csv_reader)
 
-        with open(f'realistic_{size}_{number}_extra.csv') as csv_file_extra:
+        with open(f'{path}_extra.csv') as csv_file_extra:
             csv_reader = csv.reader(csv_file_extra, delimiter=',',
                                     quoting=csv.QUOTE_NONNUMERIC)
             start_work = next(csv_reader)
@@ -37,10 +45,12 @@ class Instance:
             end_work = next(csv_reader)
             end_work = [int(x) for x in end_work]
 
-        return Instance(bus_legs, distance_matrix, start_work, end_work)
+        return Instance(bus_legs, distance_matrix, start_work, end_work, config)
 
 
 class BusLeg:
+    __slots__ = ('id', 'tour', 'start', 'end', 'start_pos', 'end_pos', 'start_shift', 'end_shift', 'name')
+
     def __init__(self, id, tour, start, end, start_pos, end_pos) -> None:
         self.id = id
         self.tour = tour
@@ -55,6 +65,10 @@ class BusLeg:
     def __hash__(self):
         return hash(self.id)
 
+    def __deepcopy__(self, memo):
+        # Legs are never modified, copies of a solution share them
+        return self
+
 
     def __getitem__(self, item):
         return self.item
@@ -71,7 +85,6 @@ class BusLeg:
 
 
 def read_solution(name):
-    os.chdir("..")
     with open(name) as csv_file:    
         csv_reader = csv.reader(csv_file, quoting=csv.QUOTE_NONNUMERIC)
         solution = list(csv_reader) 
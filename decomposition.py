@@ -0,0 +1,136 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from sortedcontainers import SortedList
+
+from config import Config
+from data import Instance, BusLeg
+from solution import Solution
+from algorithm import Algorithm, ConstructionAlgorithm, TabuSearch
+
+
+def solve_subproblem(legs: List[BusLeg], distance_matrix: List, start_work: List[int], end_work: List[int],
+                     config: Config, max_iter: int) -> List[List[int]]:
+    """ Solve the sub-instance made of 'legs' with the construction algorithm and the tabu search.
+
+    This is the job executed by the worker processes.
+    :return: the ids of the legs of every employee
+    """
+    instance = Instance(SortedList(legs), distance_matrix, start_work, end_work, config)
+    solution = ConstructionAlgorithm(instance).apply()
+    solution.evaluate(instance)
+    best_objective, best_solution = TabuSearch(instance, max_iter=max_iter).apply(solution)
+    return best_solution.shifts()
+
+
+class Decomposition(Algorithm):
+    """ Solve large instances by splitting the legs into smaller sub-instances.
+
+    Whole tours are grouped either by the time window of their start
+    (TIME_WINDOWS) or by the position of their first leg (DEPOTS). Tours
+    running past the end of a window make neighbouring windows overlap in
+    time. Every sub-instance is solved by ConstructionAlgorithm + TabuSearch
+    in its own process, then the shifts are put together and the boundary
+    employees are improved by a final tabu search.
+    """
+
+    TIME_WINDOWS = 'time_windows'
+    DEPOTS = 'depots'
+
+    def __init__(self, instance: Instance, mode: str = TIME_WINDOWS, legs_per_subproblem: int = 100,
+                 workers: int = None, max_iter: int = None, repair_iter: int = None, margin: int = 60) -> None:
+        """
+        :param mode:                TIME_WINDOWS or DEPOTS
+        :param legs_per_subproblem: Approximate number of legs of every sub-instance
+        :param workers:             Number of worker processes (number of CPUs by default, 1 runs in this process)
+        :param max_iter:            Tabu search iterations on every sub-instance (config.max_iter by default)
+        :param repair_iter:         Tabu search iterations on the boundary employees (config.max_iter by default)
+        :param margin:              Employees working within 'margin' minutes of a window boundary are repaired
+        """
+        super().__init__(instance)
+        if mode not in (self.TIME_WINDOWS, self.DEPOTS):
+            raise ValueError(f'Unknown decomposition mode {mode}')
+        self.mode = mode
+        self.legs_per_subproblem = legs_per_subproblem
+        self.workers = workers
+        self.max_iter = self.config.max_iter if max_iter is None else max_iter
+        self.repair_iter = self.config.max_iter if repair_iter is None else repair_iter
+        self.margin = margin
+
+    def apply(self):
+        print('\n*******************************')
+        print('*        DECOMPOSITION        *')
+        print('*******************************')
+        clusters = self.clusters()
+        print(f'Number of sub-instances = {len(clusters)}')
+        # Every sub-instance has its own random stream, whatever the worker running it
+        args = [(cluster, self.instance.distance_matrix, self.instance.start_work, self.instance.end_work,
+                 self.config.replace(seed=self.config.derive_seed('subproblem', k)), self.max_iter)
+                for k, cluster in enumerate(clusters)]
+        if self.workers == 1 or len(clusters) == 1:
+            shifts = [solve_subproblem(*a) for a in args]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                shifts = list(executor.map(solve_subproblem, *zip(*args)))
+        solution = self.stitch([shift for cluster_shifts in shifts for shift in cluster_shifts])
+        solution.evaluate(self.instance)
+        print(f'Stitched solution = {solution.value}')
+        self.repair(solution, self.boundaries(clusters))
+        return solution.value, solution
+
+    def tours(self) -> Dict[int, List[BusLeg]]:
+        tours = {}
+        for leg in self.instance.legs:
+            tours.setdefault(leg.tour, []).append(leg)
+        return tours
+
+    def clusters(self) -> List[List[BusLeg]]:
+        """ Split the legs into sub-instances made of whole tours """
+        tours = list(self.tours().values())
+        number = max(1, math.ceil(len(self.instance.legs) / self.legs_per_subproblem))
+        if self.mode == self.TIME_WINDOWS:
+            # Consecutive tours (by start time) with about the same number of legs
+            tours.sort(key=lambda t: t[0].start)
+            size = len(self.instance.legs) / number
+            clusters = [[] for _ in range(number)]
+            count = 0
+            for tour in tours:
+                clusters[min(number - 1, int(count / size))].extend(tour)
+                count += len(tour)
+        else:
+            # Tours of the same depot stay together, depots are spread over the least loaded clusters
+            depots = {}
+            for tour in tours:
+                depots.setdefault(tour[0].start_pos, []).extend(tour)
+            clusters = [[] for _ in range(min(number, len(depots)))]
+            for legs in sorted(depots.values(), key=len, reverse=True):
+                min(clusters, key=len).extend(legs)
+        return [cluster for cluster in clusters if cluster]
+
+    def boundaries(self, clusters: List[List[BusLeg]]) -> List[int]:
+        """ Return the times separating consecutive time windows """
+        if self.mode != self.TIME_WINDOWS:
+            return []
+        return [min(leg.start for leg in cluster) for cluster in clusters[1:]]
+
+    def stitch(self, shifts: List[List[int]]) -> Solution:
+        """ Build the solution of the full instance from the leg ids of every shift """
+        return Solution.construct_from_shifts(self.instance, shifts)
+
+    def repair(self, solution: Solution, boundaries: List[int]) -> None:
+        """ Improve the employees working around a window boundary, or working less than EMPLOYEE_W_MIN,
+            with a tabu search restricted to their legs.
+        """
+        selected = []
+        for key, e in solution.employees.items():
+            if not e.bus_legs:
+                continue
+            crossing = any(e.state.start_shift - self.margin <= t <= e.state.end_shift + self.margin
+                           for t in boundaries)
+            if crossing or e.state.work_time < self.config.employee_w_min:
+                selected.append(e)
+        if len(selected) < 2 or self.repair_iter <= 1:
+            return
+        print(f'Boundary employees = {len(selected)}')
+        self.restricted_search(solution, selected, self.repair_iter)
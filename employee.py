@@ -1,22 +1,32 @@
-
-import numpy as np
 from sortedcontainers import SortedList
 
-import config as conf
 from data import Instance, BusLeg
 from typing import List
 
 
+def copy_slots(source, **changes):
+    """ Shallow copy of an object with __slots__, with some attributes replaced """
+    output = source.__class__.__new__(source.__class__)
+    for name in source.__slots__:
+        setattr(output, name, changes[name] if name in changes else getattr(source, name))
+    return output
+
+
 class Employee:
+    __slots__ = ('id', 'bus_legs', 'state', 'previous_state', 'instance', 'objective', 'previous_objective',
+                 '_blocks', 'previous_blocks', 'working_constraints', 'driving_constraints', 'name')
 
     def __init__(self, id: int, instance: Instance) -> None:
         self.id = id
         self.bus_legs = SortedList()
         self.state = State(self)
-        self.previous_state = State(self)
+        # Replaced by evaluate() before any revert(), the empty state can be shared
+        self.previous_state = self.state
         self.instance = instance
         self.objective = 0
         self.previous_objective = 0
+        self._blocks = None
+        self.previous_blocks = None
         self.working_constraints = WorkingConstraints(self)
         self.driving_constraints = DrivingConstraints(self)
         self.name = 'E' + str(id)
@@ -34,14 +44,83 @@ class Employee:
     def revert(self):
         self.objective = self.previous_objective
         self.state = self.previous_state.copy()
+        self._blocks = self.previous_blocks
 
-    def evaluate(self):
-        """ Evaluate the objective function of the current employee  """
+    def evaluate(self, cutoff: float = None):
+        """ Evaluate the objective function of the current employee.
+
+        :param cutoff: if given, the evaluation stops as soon as the objective is known to be at least cutoff
+        (see State.evaluate)
+        """
         self.previous_state = self.state
         self.previous_objective = self.objective
+        # The index of the previous legs is kept for revert(), the new one is built when it is read
+        self.previous_blocks = self._blocks
+        self._blocks = None
         self.state = State(self)
-        self.objective = self.state.evaluate()
+        self.objective = self.state.evaluate(cutoff)
         return self.objective
+
+    def lower_bound(self, legs_in: List[BusLeg], legs_out: List[BusLeg]) -> int:
+        """ Return a lower bound of the objective after adding legs_in and removing legs_out.
+
+        The start and end of the shift and the drive time are read from the cached state, the legs of the
+        employee are only scanned from an end of the shift when its first or last leg is in legs_out,
+        so the cost depends on the number of legs moved, not on the number of legs of the employee:
+            span + 2*EMPLOYEE_W_MIN + 1000*(span and drive time over their maximum)
+        """
+        first = last = start_shift = end_shift = None
+        if self.bus_legs:
+            removed = {leg.id for leg in legs_out}
+            first, last = self.bus_legs[0], self.bus_legs[-1]
+            if first.id in removed:
+                first = next((leg for leg in self.bus_legs if leg.id not in removed), None)
+            else:
+                start_shift = self.state.start_shift
+            if last.id in removed:
+                last = next((leg for leg in reversed(self.bus_legs) if leg.id not in removed), None)
+            else:
+                end_shift = self.state.end_shift
+        for leg in legs_in:
+            if first is None or leg < first:
+                first, start_shift = leg, None
+            if last is None or last < leg:
+                last, end_shift = leg, None
+        if first is None:
+            return 0
+        if start_shift is None:
+            start_shift = first.start - self.instance.start_work[first.start_pos]
+        if end_shift is None:
+            end_shift = last.end + self.instance.end_work[last.end_pos]
+        span = end_shift - start_shift
+        drive_time = self.state.drive_time + sum(leg.drive for leg in legs_in) - sum(leg.drive for leg in legs_out)
+        config = self.instance.config
+        hard = max(span - config.employee_t_max, 0) + max(drive_time - config.employee_d_max, 0)
+        return span + 2*config.employee_w_min + 1000*hard
+
+    @property
+    def blocks(self) -> List[List[BusLeg]]:
+        """ Block index of the employee (see tour_blocks), built on the first read after a change of the legs.
+            evaluate() resets it and revert() restores the index of the previous legs, so only the employees
+            of accepted moves rebuild it.
+        """
+        if self._blocks is None:
+            self._blocks = self.tour_blocks()
+        return self._blocks
+
+    @blocks.setter
+    def blocks(self, blocks: List[List[BusLeg]]) -> None:
+        self._blocks = blocks
+
+    def tour_blocks(self) -> List[List[BusLeg]]:
+        """ Split the legs into maximal runs of consecutive legs of the same tour """
+        blocks = []
+        for leg in self.bus_legs:
+            if blocks and blocks[-1][-1].tour == leg.tour:
+                blocks[-1].append(leg)
+            else:
+                blocks.append([leg])
+        return blocks
         
     def passive_ride(self, i: int, j: int) -> float:
         if i == j:
@@ -50,6 +129,48 @@ class Employee:
             return self.instance.distance_matrix[i][j]
 
 
+    def overlay(self):
+        """ Generate the legs of the employee with the intervals shown around them, in time order:
+            start of work ('S'), passive rides ('R'), paid ('P') and unpaid ('U') breaks, end of work ('E').
+
+        The intervals are new BusLegs without id, computed from the evaluated state.
+        The employee is not modified, so it can be generated during the search.
+        """
+        if not self.bus_legs:
+            return
+        first_leg = self.bus_legs[0]
+        last_leg = self.bus_legs[-1]
+        if self.state.start_shift < first_leg.start:
+            start = BusLeg(None, 'S', self.state.start_shift, first_leg.start, 0, 0)
+            start.name = 'Start'
+            yield start
+        a = self.state.start_shift + 2*60
+        b = self.state.end_shift - 2*60
+        gaps = []
+        for leg_i, leg_j in zip(self.bus_legs, self.bus_legs[1:]):
+            gaps.append((leg_i, leg_j, self.passive_ride(int(leg_i.end_pos), int(leg_j.start_pos))))
+        # Same rule as WorkingConstraints.read_unpaid, whose flags are not restored by revert()
+        pauses = [(leg_i, leg_j.start - leg_i.end - r) for leg_i, leg_j, r in gaps if leg_j.start - leg_i.end - r < 180]
+        breaks = (any(p >= 15 and leg_i.end <= a + 6*60 for leg_i, p in pauses)
+                  and any(p >= 30 for leg_i, p in pauses))
+        for leg_i, leg_j, r in gaps:
+            yield leg_i
+            end_break = leg_j.start - r
+            if breaks:
+                if min(a, end_break) - leg_i.end >= 15:
+                    yield BusLeg(None, 'P', leg_i.end, min(a, end_break), 0, 0)
+                if min(b, end_break) - max(a, leg_i.end) >= 15:
+                    yield BusLeg(None, 'U', max(a, leg_i.end), min(b, end_break), 0, 0)
+                if end_break - max(a, b, leg_i.end) >= 15:
+                    yield BusLeg(None, 'P', max(a, b, leg_i.end), end_break, 0, 0)
+            if r > 0:
+                yield BusLeg(None, 'R', end_break, leg_j.start, 0, 0)
+        yield last_leg
+        if self.state.end_shift > last_leg.end:
+            end = BusLeg(None, 'E', last_leg.end, self.state.end_shift, 0, 0)
+            end.name = 'End'
+            yield end
+
     def _eq_(self, other):
         if isinstance(other, Employee):
             return self.id == other.id
@@ -64,8 +185,38 @@ class Employee:
         output.objective = self.objective
         return output
 
+    def __deepcopy__(self, memo):
+        """ Independent copy sharing what is never modified in place:
+            the instance, the legs, the blocks and the constraints of the evaluated states
+        """
+        output = copy_slots(self)
+        memo[id(self)] = output
+        output.bus_legs = self.bus_legs.copy()
+        output.state = copy_slots(self.state, employee=output)
+        if self.previous_state is self.state:
+            output.previous_state = output.state
+        else:
+            output.previous_state = copy_slots(self.previous_state, employee=output)
+        output.working_constraints = copy_slots(self.working_constraints, employee=output)
+        output.driving_constraints = copy_slots(self.driving_constraints, employee=output)
+        return output
+
+
+class EmployeeOverlay:
+    """ Row of a visualization: iterating over it generates Employee.overlay() """
+    __slots__ = ('employee', 'name')
+
+    def __init__(self, employee: Employee) -> None:
+        self.employee = employee
+        self.name = employee.name
+
+    def __iter__(self):
+        return self.employee.overlay()
+
 
 class DrivingConstraints:
+    __slots__ = ('employee', 'dc', 'block', 'b_15', 'b_20')
+
     def __init__(self, employee: Employee) -> None:
         self.employee = employee
         self.dc = 0
@@ -101,6 +252,8 @@ class DrivingConstraints:
 
 
 class WorkingConstraints:
+    __slots__ = ('employee', 'rest', 'first15', 'break30', 'center30', 'unpaid')
+
     def __init__(self, employee: Employee) -> None:
         self.employee = employee
         self.rest = 0
@@ -257,6 +410,8 @@ class WorkingConstraints:
 
 
 class Constraints:
+    __slots__ = ('name', 'category', 'weight', 'value')
+
     def __init__(self, name: str, category: int, weight: float, value: float) -> None:
         self.name = name
         self.category = category
@@ -272,9 +427,12 @@ class Constraints:
 
 
 class State:
+    __slots__ = ('employee', 'constraints', 'work_time', 'drive_time', 'total_time', 'end_ls', 'start_fs',
+                 'start_shift', 'end_shift', 'change', 'ride', 'split', 'start', 'end', 'bus_penalty',
+                 'drive_penalty', 'rest_penalty', 'cut', 'hard', 'soft')
+
     def __init__(self, employee: Employee):
         self.employee = employee
-        self.MultiValue = {}
         self.constraints = []
         self.work_time = 0
         self.drive_time = 0
@@ -291,12 +449,23 @@ class State:
         self.bus_penalty = 0
         self.drive_penalty = 0
         self.rest_penalty = 0
+        self.cut = False
+        self.hard = 0
+        self.soft = 0
         # self.working_constraints = WorkingConstraints(self)
         # self.driving_constraints = DrivingConstraints(self)
 
-    def evaluate(self):
+    def evaluate(self, cutoff: float = None):
+        """ Evaluate the constraints of the employee, and return hard + soft.
+
+        With a cutoff, a lower bound of the objective is updated after every
+        group of constraints, starting with the cheap ones, and the evaluation
+        stops as soon as it is at least cutoff. In that case 'cut' is set,
+        the lower bound is returned and the constraints are not filled.
+        """
         if not self.employee.bus_legs:
            return 0
+        config = self.employee.instance.config
         evaluation = 0
         self.bus_penalty = 0
         self.drive_time = 0
@@ -311,6 +480,12 @@ class State:
         self.total_time = self.end_shift - self.start_shift
         for leg in self.employee.bus_legs:
             self.drive_time += leg.drive
+        if cutoff is not None:
+            # 2*max(work_time, EMPLOYEE_W_MIN) >= 2*EMPLOYEE_W_MIN
+            bound = self.total_time + 2*config.employee_w_min
+            bound += 1000*(max(self.total_time - config.employee_t_max, 0) + max(self.drive_time - config.employee_d_max, 0))
+            if bound >= cutoff:
+                return self.stop(bound)
         for key, leg in enumerate(self.employee.bus_legs[:-1]):
             leg_i = self.employee.bus_legs[key]
             leg_j = self.employee.bus_legs[key+1]
@@ -333,31 +508,50 @@ class State:
                 if (diff - r >= 180):
                     self.split += 1
                     split_time += diff - r
+        if cutoff is not None:
+            bound += 1000*self.bus_penalty + 30*self.change + self.ride + 180*self.split
+            if bound >= cutoff:
+                return self.stop(bound)
         unpaid = self.employee.working_constraints.read_unpaid()
         # unpaid, rest_penalty = self.employee.working_constraints.evaluate()
         self.work_time = self.total_time - unpaid - split_time
+        if cutoff is not None:
+            bound += 2*max(self.work_time - config.employee_w_min, 0) + 1000*max(self.work_time - config.employee_w_max, 0)
+            if bound >= cutoff:
+                return self.stop(bound)
         self.drive_penalty = self.employee.driving_constraints.drive_penalty()
+        if cutoff is not None:
+            bound += 1000*self.drive_penalty
+            if bound >= cutoff:
+                return self.stop(bound)
         # self.rest_penalty = rest_penalty
         self.rest_penalty = self.employee.working_constraints.rest_penalty()
 
         ## Constraint adding:
         self.constraints.append(Constraints('Max(bus_chain_penalty)', 0, 1000, self.bus_penalty))
-        self.constraints.append(Constraints('Max(drive_time):', 0, 1000, max(self.drive_time - conf.EMPLOYEE_D_MAX, 0)))
-        self.constraints.append(Constraints('Max(span):', 0, 1000, max(self.total_time - conf.EMPLOYEE_T_MAX, 0)))
+        self.constraints.append(Constraints('Max(drive_time):', 0, 1000, max(self.drive_time - config.employee_d_max, 0)))
+        self.constraints.append(Constraints('Max(span):', 0, 1000, max(self.total_time - config.employee_t_max, 0)))
         self.constraints.append(Constraints('Max(span):', 1, 1, self.total_time))
         self.constraints.append(Constraints('Max(tour_changes):', 1, 30, self.change))
         self.constraints.append(Constraints('Max(ride_time):', 1, 1, self.ride))
         self.constraints.append(Constraints('Max(drive penalty):', 0, 1000, self.drive_penalty))
         self.constraints.append(Constraints('Max(rest penalty):', 0, 1000, self.rest_penalty))
-        self.constraints.append(Constraints('Max(work_time):', 0, 1000, max(self.work_time - conf.EMPLOYEE_W_MAX, 0)))  
+        self.constraints.append(Constraints('Max(work_time):', 0, 1000, max(self.work_time - config.employee_w_max, 0)))  
         self.constraints.append(Constraints('Max(work_time):', 1, 2, self.work_time))
-        self.constraints.append(Constraints('Min(work_time):', 1, 2, max(conf.EMPLOYEE_W_MIN - self.work_time, 0)))
+        self.constraints.append(Constraints('Min(work_time):', 1, 2, max(config.employee_w_min - self.work_time, 0)))
         self.constraints.append(Constraints('Max(shift_split):', 1, 180, self.split))
         # output = self.finalSum()
         hard, soft = self.finalSum()
-        self.MultiValue = {0: hard, 1: soft}
+        self.hard = hard
+        self.soft = soft
         return hard + soft
 
+    def stop(self, bound: int) -> int:
+        """ Stop an evaluation worse than its cutoff """
+        self.cut = True
+        self.hard = int(bound)
+        return int(bound)
+
     def finalSum(self) -> List[int]:
         s_0 = 0
         s_1 = 0
@@ -368,8 +562,10 @@ class State:
                 s_0 += con.weight * con.value
         return int(s_0), int(s_1)
 
+    @property
+    def MultiValue(self) -> dict:
+        return {0: self.hard, 1: self.soft}
+
     def copy(self):
-        employee_copy = self.employee.copy()
-        new_state = State(employee_copy)
-        new_state.__dict__.update(self.__dict__)
-        return new_state
+        """ Shallow copy, still referring to the same employee """
+        return copy_slots(self)
@@ -0,0 +1,94 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+from data import Instance
+from solution import Solution
+from algorithm import Algorithm, ConstructionAlgorithm
+
+
+# Instance of the worker processes, set once by their initializer
+_worker_instance = None
+
+
+def _init_worker(instance: Instance) -> None:
+    global _worker_instance
+    _worker_instance = instance
+
+
+def randomized_construction(alpha: float, seed: int, lexicographic: bool) -> Tuple[int, List[List[int]]]:
+    """ Build one randomized greedy solution of the worker instance.
+
+    This is the job executed by the worker processes.
+    :return: the evaluation and the leg ids of every employee
+    """
+    instance = _worker_instance
+    solution = ConstructionAlgorithm(instance, lexicographic=lexicographic, alpha=alpha, seed=seed).apply()
+    solution.evaluate(instance)
+    return solution.value, solution.shifts()
+
+
+def distance(shifts_1: List[List[int]], shifts_2: List[List[int]]) -> int:
+    """ Number of shifts of the first solution that are not in the second one """
+    return len({tuple(s) for s in shifts_1} - {tuple(s) for s in shifts_2})
+
+
+class GRASP(Algorithm):
+    """ Greedy randomized construction.
+
+    Many randomized constructions (ConstructionAlgorithm with alpha > 0) are
+    run in parallel worker processes, and the best ones, different enough
+    from each other, are returned as starting solutions for the search.
+    """
+
+    def __init__(self, instance: Instance, constructions: int = 16, alpha: float = 0.1, top: int = 3,
+                 min_distance: int = 1, workers: int = None, lexicographic: bool = False,
+                 seed: int = None) -> None:
+        """
+        :param constructions: Number of randomized constructions
+        :param alpha:         Size of the restricted candidate list (see ConstructionAlgorithm)
+        :param top:           Number of solutions returned
+        :param min_distance:  Minimum number of different shifts between two returned solutions
+        :param workers:       Number of worker processes (number of CPUs by default, 1 runs in this process)
+        :param lexicographic: Compare (hard, soft) lexicographically in the constructions
+        :param seed:          Seed from which the seeds of the constructions are drawn (derived from config.seed
+                              by default), the results do not depend on the number of workers
+        """
+        super().__init__(instance)
+        self.constructions = constructions
+        self.alpha = alpha
+        self.top = top
+        self.min_distance = min_distance
+        self.workers = workers
+        self.lexicographic = lexicographic
+        self.seed = seed
+
+    def apply(self) -> List[Tuple[int, Solution]]:
+        print('\n*******************************')
+        print('*            GRASP            *')
+        print('*******************************')
+        rng = self.make_random(self.seed)
+        seeds = [rng.getrandbits(32) for _ in range(self.constructions)]
+        args = [(self.alpha, seed, self.lexicographic) for seed in seeds]
+        if self.workers == 1:
+            _init_worker(self.instance)
+            results = [randomized_construction(*a) for a in args]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.instance,)) as executor:
+                results = list(executor.map(randomized_construction, *zip(*args)))
+        results.sort(key=lambda r: r[0])
+        print(f'Constructions = {len(results)}, best = {results[0][0]}, worst = {results[-1][0]}')
+        selected = []
+        for value, shifts in results:
+            if len(selected) == self.top:
+                break
+            if all(distance(shifts, other) >= self.min_distance for _, other in selected):
+                selected.append((value, shifts))
+        output = []
+        for value, shifts in selected:
+            solution = Solution.construct_from_shifts(self.instance, shifts)
+            solution.evaluate(self.instance)
+            output.append((solution.value, solution))
+        print('Selected =', [value for value, _ in output])
+        print()
+        return output
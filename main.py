@@ -1,70 +1,13 @@
-import numpy as np
+import argparse
 import time
 
+from config import Config
 from data import Instance, read_solution
-from algorithm import Algorithm, ConstructionAlgorithm, TabuSearch
+from algorithm import ConstructionAlgorithm, TabuSearch, FleetReduction, SetPartitioning
+from columns import ColumnPool
 from solution import Solution
-import config as conf
-from IntervalVisualizer import IntervalVisualizer
 
 
-
-instance = Instance.read_data(conf.INSTANCE_SIZE, conf.INSTANCE_NUMBER)
-algorithm = Algorithm(instance)
-
-# ---------------------- #
-# CONSTRUCTIVE ALGORITHM #
-# ---------------------- # 
-start = time.process_time()
-initial_solution = ConstructionAlgorithm(instance).apply()
-duration = time.process_time() - start
-initial_solution.evaluate(instance)
-print(f'Finished execution in {duration} with value {initial_solution.value}')
-# initial_solution.print_objective()
-
-# -------------- #
-# READ FROM FILE #
-# -------------- # 
-
-# initial_solution = Solution.construct_solution(instance, read_solution(conf.NAME))
-# initial_solution.evaluate(instance)
-# solution.print_objective()
-
-
-
-# ----------- #
-# TABU SEARCH #
-# ----------- # 
-# Set verbosity. Verb = 0: no description
-verb = 0
-if verb != 0:
-    print('\n****************')
-    print('*   INSTANCE   *')
-    print('****************')
-    print('Number of legs =', len(instance.legs))
-    print('Number of employees =', len(initial_solution.employees))
-    print(f'Number of maximum iterations = {conf.MAX_ITER}')
-    print(f'Tabu tenure = {conf.TABU_LENGTH}')
-    print(f'Starting objective = {initial_solution.evaluation}')
-
-start = time.process_time()
-best_objective, best_solution = TabuSearch(instance).apply(initial_solution)
-duration = time.process_time() - start
-print(f'Finished execution in {duration} with value {best_objective}')
-
-final_solution = best_solution.removeEmptyEmployees()
-
-# final_solution.evaluate(instance)
-# final_solution.print_objective()
-# best_solution.print_to_file()
-
-
-
-# intervals = result.employees
-# visualizer = IntervalVisualizer(axis=IntervalVisualizer.AXIS_HOURS)
-# visualizer.create(intervals, 'Results', 'tour', hover, 'tour').show()
-# best_solution = best_solution.visualize_solution()
-
 def hover(interval):
     if getattr(interval, 'tour', None) == 'S':
         string = '<b>Start work​​​​​</b><br>' \
@@ -110,31 +53,122 @@ def hover(interval):
         return string
 
 
-
-
-
-
-
-
-
-
-
-# best_solution = algorithm.local_search(solution)
-# print('initial solution = ',solution.evaluation)
-# best_solution, best_evaluation = algorithm.best_improvement(solution)
-# print('best improvement = ', best_evaluation)
-# best_solution.evaluate(instance)
-# print(solution.move())
-# best_solution.print_objective()
-# solution.print_objective()
-
-
-# print(best_solution)
-# best_solution.evaluate(instance)
-# best_solution.visualize_solution()
-# visualizer.create(best_solution.employees, 'Results', 'tour', hover, 'tour').show()
-
-# visualizer.create(output.employees, 'Results', 'tour', hover, 'tour').show()
-
-
-
+def visualize(solution: Solution, html: str = None, max_rows: int = None) -> None:
+    """ Show the shifts of the solution, or write them to the 'html' file, plotly is only imported when it is called """
+    from IntervalVisualizer import IntervalVisualizer
+    visualizer = IntervalVisualizer(axis=IntervalVisualizer.AXIS_HOURS)
+    fig = visualizer.create(solution.overlays(), 'Results', 'tour', hover, 'tour', aggregate=True, max_rows=max_rows)
+    if html is None:
+        fig.show()
+    else:
+        visualizer.write_html(fig, html)
+
+
+def positive_int(value: str) -> int:
+    """ argparse type of the options counting something, at least 1 """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive integer')
+    return number
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Bus driver scheduling with construction and tabu search')
+    parser.add_argument('--directory', default='busdriver_instances', help='Directory of the instances')
+    parser.add_argument('--read-solution', metavar='FILE', default=None,
+                        help='Start from the solution stored in FILE instead of the construction algorithm')
+    parser.add_argument('--output', action='store_true', help='Write the best solution to TabuSearchResult.csv')
+    parser.add_argument('--visualize', action='store_true', help='Show the best solution with plotly')
+    parser.add_argument('--html', metavar='FILE', default=None, help='Write the visualization to FILE instead')
+    parser.add_argument('--max-rows', type=positive_int, default=None, help='Maximum number of employees visualized')
+    parser.add_argument('--fleet-reduction', action='store_true',
+                        help='Reduce the number of employees of the constructed solution before the tabu search')
+    parser.add_argument('--set-partitioning', action='store_true',
+                        help='Collect the shifts met by the tabu search and recombine them after it')
+    parser.add_argument('--max-time', type=float, default=None,
+                        help='Time limit of the tabu search in seconds (only max-iter by default)')
+    parser.add_argument('--verbose', action='store_true', help='Describe the instance before the search')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile the construction and the tabu search instead of solving the instance')
+    parser.add_argument('--folded', default='profile.folded', help='Flame graph stacks written by --profile')
+    # --instance-size, --max-iter, --employee-w-min, ... over the BDS_* environment variables
+    Config.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # A random seed is drawn if none is given, it is printed so that the run can be reproduced with --seed
+    config = Config.from_args(args).with_seed()
+    print(f'Seed = {config.seed}')
+    instance = Instance.read_data(config.instance_size, config.instance_number, args.directory, config)
+    if args.profile:
+        from profiling import profile
+        return profile(instance, folded=args.folded)
+
+    if args.read_solution is None:
+        # ---------------------- #
+        # CONSTRUCTIVE ALGORITHM #
+        # ---------------------- #
+        start = time.process_time()
+        initial_solution = ConstructionAlgorithm(instance).apply()
+        duration = time.process_time() - start
+        initial_solution.evaluate(instance)
+        print(f'Finished execution in {duration} with value {initial_solution.value}')
+
+        # --------------- #
+        # FLEET REDUCTION #
+        # --------------- #
+        if args.fleet_reduction:
+            start = time.process_time()
+            reduced_objective, initial_solution = FleetReduction(instance).apply(initial_solution)
+            duration = time.process_time() - start
+            print(f'Finished execution in {duration} with value {reduced_objective}')
+    else:
+        # -------------- #
+        # READ FROM FILE #
+        # -------------- #
+        initial_solution = Solution.construct_solution(instance, read_solution(args.read_solution))
+        initial_solution.evaluate(instance)
+
+    # ----------- #
+    # TABU SEARCH #
+    # ----------- #
+    if args.verbose:
+        print('\n****************')
+        print('*   INSTANCE   *')
+        print('****************')
+        print('Number of legs =', len(instance.legs))
+        print('Number of employees =', len(initial_solution.employees))
+        print(f'Number of maximum iterations = {config.max_iter}')
+        print(f'Tabu tenure = {config.tabu_length}')
+        print(f'Starting objective = {initial_solution.value}')
+
+    pool = None
+    if args.set_partitioning:
+        pool = ColumnPool()
+        pool.add_solution(initial_solution)
+    start = time.process_time()
+    best_objective, best_solution = TabuSearch(instance, pool=pool, max_time=args.max_time).apply(initial_solution)
+    duration = time.process_time() - start
+    print(f'Finished execution in {duration} with value {best_objective}')
+
+    # ---------------- #
+    # SET PARTITIONING #
+    # ---------------- #
+    if args.set_partitioning:
+        start = time.process_time()
+        best_objective, best_solution = SetPartitioning(instance, pool).apply(best_solution)
+        duration = time.process_time() - start
+        print(f'Finished execution in {duration} with value {best_objective}')
+
+    final_solution = best_solution.removeEmptyEmployees()
+    if args.output:
+        final_solution.print_to_file()
+    if args.visualize or args.html is not None:
+        visualize(final_solution, args.html, args.max_rows)
+    return final_solution
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+from typing import Iterator, List, Tuple
+
+from data import BusLeg
+from solution import Solution
+
+
+class Move:
+    """ A move between two employees: legs_out go from employee i to employee j,
+        legs_in go from employee j to employee i.
+        Only the two employees are evaluated again, so the cost of a move is
+        independent of the size of the solution.
+    """
+
+    def __init__(self, i: int, j: int, legs_out: List[BusLeg], legs_in: List[BusLeg] = ()) -> None:
+        self.i = i
+        self.j = j
+        self.legs_out = list(legs_out)
+        self.legs_in = list(legs_in)
+
+    def execute(self, solution: Solution, cutoff: float = None) -> float:
+        return solution.execute_exchange(self.i, self.j, self.legs_out, self.legs_in, cutoff)
+
+    def revert(self, solution: Solution) -> float:
+        return solution.revert_exchange(self.i, self.j, self.legs_out, self.legs_in)
+
+    def lower_bound(self, solution: Solution) -> float:
+        """ Return a lower bound of the evaluation of the solution after the move, without executing it """
+        employee_i = solution.employees[self.i]
+        employee_j = solution.employees[self.j]
+        bound = solution.value - employee_i.objective - employee_j.objective
+        bound += employee_i.lower_bound(self.legs_in, self.legs_out)
+        bound += employee_j.lower_bound(self.legs_out, self.legs_in)
+        return bound
+
+    def hash_delta(self) -> int:
+        """ Return the change of the solution hash made by the move, before executing it """
+        return Solution.exchange_hash(self.i, self.j, self.legs_out, self.legs_in)
+
+    def attributes(self) -> List[Tuple[int, int]]:
+        """ Return the (employee, leg id) pairs created by the move.
+            The move is tabu if one of them is tabu.
+        """
+        return [(self.j, leg.id) for leg in self.legs_out] + [(self.i, leg.id) for leg in self.legs_in]
+
+    def reverse_attributes(self) -> List[Tuple[int, int]]:
+        """ Return the (employee, leg id) pairs destroyed by the move.
+            They become tabu once the move is executed.
+        """
+        return [(self.i, leg.id) for leg in self.legs_out] + [(self.j, leg.id) for leg in self.legs_in]
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.i}, {self.j}, {[leg.id for leg in self.legs_out]}, ' \
+               f'{[leg.id for leg in self.legs_in]})'
+
+
+class RelocateMove(Move):
+    """ Move one leg from employee i to employee j. """
+
+    def __init__(self, i: int, j: int, leg: BusLeg) -> None:
+        super().__init__(i, j, [leg])
+        self.leg = leg
+
+    def execute(self, solution: Solution, cutoff: float = None) -> float:
+        return solution.execute_move(self.i, self.j, self.leg, cutoff)
+
+    def revert(self, solution: Solution) -> float:
+        return solution.revert(self.i, self.j, self.leg)
+
+
+class SwapMove(Move):
+    """ Swap leg_i of employee i with leg_j of employee j. """
+
+    def __init__(self, i: int, j: int, leg_i: BusLeg, leg_j: BusLeg) -> None:
+        super().__init__(i, j, [leg_i], [leg_j])
+
+
+class BlockMove(Move):
+    """ Move a contiguous block of legs of the same tour from employee i to employee j. """
+
+
+class TailExchangeMove(Move):
+    """ 2-opt like move: exchange the legs of employee i and employee j starting after time t. """
+
+    def __init__(self, i: int, j: int, t: int, tail_i: List[BusLeg], tail_j: List[BusLeg]) -> None:
+        super().__init__(i, j, tail_i, tail_j)
+        self.t = t
+
+
+class Neighborhood:
+    """ A neighborhood yields the moves that can be applied to a solution.
+
+    The moves are executed and reverted one at a time by the search, so the
+    generator can rely on the solution being unchanged between two moves.
+    """
+
+    name = 'neighborhood'
+
+    def moves(self, solution: Solution) -> Iterator[Move]:
+        raise NotImplementedError
+
+
+class RelocateNeighborhood(Neighborhood):
+    """ Assign one leg to an other employee. """
+
+    name = 'relocate'
+
+    def moves(self, solution: Solution) -> Iterator[Move]:
+        for i, employee_1 in solution.employees.items():
+            for leg in list(employee_1.bus_legs):
+                for j, employee_2 in solution.employees.items():
+                    if employee_1 == employee_2:
+                        continue
+                    yield RelocateMove(i, j, leg)
+
+
+class SwapNeighborhood(Neighborhood):
+    """ Swap two legs between two employees.
+
+    Only legs overlapping in time are swapped: the other pairs can be
+    reached by two relocations without creating an overlap.
+    """
+
+    name = 'swap'
+
+    def moves(self, solution: Solution) -> Iterator[Move]:
+        keys = list(solution.employees.keys())
+        for a, i in enumerate(keys):
+            legs_i = list(solution.employees[i].bus_legs)
+            for j in keys[a+1:]:
+                legs_j = list(solution.employees[j].bus_legs)
+                for leg_i in legs_i:
+                    for leg_j in legs_j:
+                        if leg_j.start >= leg_i.end:
+                            break
+                        if leg_i.start < leg_j.end:
+                            yield SwapMove(i, j, leg_i, leg_j)
+
+
+class BlockNeighborhood(Neighborhood):
+    """ Move a maximal run of consecutive legs of the same tour to an other employee.
+
+    The runs are read from the block index of each employee (Employee.blocks),
+    which is rebuilt whenever the employee is evaluated. With min_length=1
+    every leg belongs to exactly one block, so the neighborhood replaces the
+    relocation of single legs with fewer, larger moves.
+    """
+
+    name = 'block'
+
+    def __init__(self, min_length: int = 2) -> None:
+        self.min_length = min_length
+
+    def moves(self, solution: Solution) -> Iterator[Move]:
+        for i, employee_1 in solution.employees.items():
+            for block in employee_1.blocks:
+                if len(block) < self.min_length:
+                    continue
+                for j, employee_2 in solution.employees.items():
+                    if employee_1 == employee_2:
+                        continue
+                    yield BlockMove(i, j, block)
+
+
+class TailExchangeNeighborhood(Neighborhood):
+    """ Exchange the tails of two shifts, cut at the start of one of their legs. """
+
+    name = 'tail_exchange'
+
+    def moves(self, solution: Solution) -> Iterator[Move]:
+        keys = list(solution.employees.keys())
+        for a, i in enumerate(keys):
+            legs_i = list(solution.employees[i].bus_legs)
+            if not legs_i:
+                continue
+            for j in keys[a+1:]:
+                legs_j = list(solution.employees[j].bus_legs)
+                if not legs_j:
+                    continue
+                cuts = sorted({leg.start for leg in legs_i} | {leg.start for leg in legs_j})
+                for t in cuts:
+                    tail_i = [leg for leg in legs_i if leg.start >= t]
+                    tail_j = [leg for leg in legs_j if leg.start >= t]
+                    if len(tail_i) == len(legs_i) and len(tail_j) == len(legs_j):
+                        continue
+                    if not tail_i and not tail_j:
+                        continue
+                    yield TailExchangeMove(i, j, t, tail_i, tail_j)
+
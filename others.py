@@ -1,12 +1,11 @@
 import csv
 import os
-import numpy as np
 import time
 from copy import deepcopy
 from sortedcontainers import SortedList
 
 import config as conf
-from input_reading import Instance, BusLeg
+from data import Instance, BusLeg
 from typing import List
 from employee import Employee
 
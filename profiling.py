@@ -0,0 +1,274 @@
+import ast
+import contextlib
+import copy
+import cProfile
+import glob
+import os
+import pstats
+import signal
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from data import Instance
+from solution import Solution
+from algorithm import ConstructionAlgorithm, TabuSearch
+
+
+# Functions always shown in the report, even when they do not rank in the top ones
+HOT_FUNCTIONS = (
+    'employee.State.evaluate',
+    'employee.WorkingConstraints.read_unpaid',
+    'employee.DrivingConstraints.drive_penalty',
+    'employee.WorkingConstraints.rest_penalty',
+    'solution.Solution.execute_move',
+    'solution.Solution.revert',
+    'copy.deepcopy',
+)
+
+
+class FunctionIndex:
+    """ Find the function (module.qualname) of a line of the project modules and of the copy module """
+
+    def __init__(self, directory: str = None) -> None:
+        directory = os.path.dirname(os.path.abspath(__file__)) if directory is None else directory
+        self.functions = {}
+        for filename in glob.glob(os.path.join(directory, '*.py')) + [copy.__file__]:
+            self.functions[os.path.abspath(filename)] = self.parse(filename)
+        self.cache = {}
+        self.tracebacks = {}
+
+    @staticmethod
+    def parse(filename: str) -> List[Tuple[int, int, str]]:
+        """ Return (first line, last line, name) of every function of a module, inner functions last """
+        module = os.path.splitext(os.path.basename(filename))[0]
+        with open(filename, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        functions = []
+
+        def visit(node, prefix):
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    name = f'{prefix}.{child.name}'
+                    if not isinstance(child, ast.ClassDef):
+                        start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                        functions.append((start, child.end_lineno, name))
+                    visit(child, name)
+                else:
+                    visit(child, prefix)
+
+        visit(tree, module)
+        return functions
+
+    def name(self, filename: str, lineno: int) -> str:
+        """ Return the innermost function containing the line, None outside of the indexed modules """
+        key = (filename, lineno)
+        if key not in self.cache:
+            name = None
+            for start, end, function in self.functions.get(os.path.abspath(filename), ()):
+                if start <= lineno <= end:
+                    name = function
+            self.cache[key] = name
+        return self.cache[key]
+
+    def traceback_names(self, traceback: tracemalloc.Traceback) -> frozenset:
+        """ Return the indexed functions of the frames of a traceback """
+        if traceback not in self.tracebacks:
+            names = {self.name(frame.filename, frame.lineno) for frame in traceback}
+            names.discard(None)
+            self.tracebacks[traceback] = frozenset(names)
+        return self.tracebacks[traceback]
+
+
+class StackSampler:
+    """ Statistical profiler writing flame graph input.
+
+    The Python stack is recorded every 'interval' seconds of CPU time
+    (SIGPROF), and written in the folded format read by flamegraph.pl,
+    speedscope or inferno: one 'module:function;module:function count' line per stack.
+    """
+
+    def __init__(self, interval: float = 0.001) -> None:
+        self.interval = interval
+        self.stacks = Counter()
+        self.previous = None
+
+    @staticmethod
+    def frame_name(code) -> str:
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        return f'{module}:{getattr(code, "co_qualname", code.co_name)}'
+
+    def sample(self, signum, frame) -> None:
+        stack = []
+        while frame is not None:
+            stack.append(self.frame_name(frame.f_code))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self) -> 'StackSampler':
+        self.previous = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous)
+
+    def write(self, path: str) -> None:
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def solve(instance: Instance, max_iter: int = None) -> Solution:
+    """ The profiled run: construction, then a tabu search of max_iter iterations, without their output """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        solution = ConstructionAlgorithm(instance).apply()
+        solution.evaluate(instance)
+        best_objective, best_solution = TabuSearch(instance, max_iter=max_iter).apply(solution)
+    return best_solution
+
+
+def time_report(stats: pstats.Stats, index: FunctionIndex) -> Dict[str, Tuple[int, float, float]]:
+    """ Return the calls, own time and cumulative time of every indexed function.
+
+    The own time of the generator expressions, comprehensions and lambdas is
+    added to the function containing them. Their calls and cumulative time are
+    not, the cumulative time of the function already includes them.
+    """
+    report = {}
+    for (filename, lineno, function), (cc, nc, tt, ct, callers) in stats.stats.items():
+        name = index.name(filename, lineno)
+        if name is None:
+            continue
+        calls, own, cumulative = report.get(name, (0, 0.0, 0.0))
+        if name.rsplit('.', 1)[-1] == function:
+            report[name] = (calls + nc, own + tt, cumulative + ct)
+        else:
+            report[name] = (calls, own + tt, cumulative)
+    return report
+
+
+def memory_report(snapshot: tracemalloc.Snapshot, index: FunctionIndex,
+                  before: tracemalloc.Snapshot = None) -> Dict[str, int]:
+    """ Return the size of the memory blocks allocated by every indexed function, directly or by the functions
+        it calls, alive in the snapshot, or the growth of this size since 'before' if given.
+
+    The blocks allocated by MemorySampler.sample itself are ignored.
+    """
+    if before is None:
+        blocks = ((stat.traceback, stat.size) for stat in snapshot.statistics('traceback'))
+    else:
+        blocks = ((stat.traceback, stat.size_diff) for stat in snapshot.compare_to(before, 'traceback'))
+    report = {}
+    for traceback, size in blocks:
+        names = index.traceback_names(traceback)
+        if MemorySampler.NAME in names:
+            continue
+        for name in names:
+            report[name] = report.get(name, 0) + size
+    return report
+
+
+class MemorySampler:
+    """ Peak memory of every function during a run traced by tracemalloc.
+
+    Every 'interval' seconds of CPU time (SIGPROF), a snapshot is taken and
+    the live memory of every function (see memory_report) is compared to its
+    maximum so far. Unlike a single snapshot at the end, this catches the
+    memory only alive while a function runs, like the states of the
+    candidate moves.
+    """
+
+    NAME = 'profiling.MemorySampler.sample'
+
+    def __init__(self, index: FunctionIndex, interval: float = 0.1) -> None:
+        self.index = index
+        self.interval = interval
+        self.peak = {}
+        self.samples = 0
+        self.previous = None
+
+    def sample(self, signum, frame) -> None:
+        for name, size in memory_report(tracemalloc.take_snapshot(), self.index).items():
+            if size > self.peak.get(name, 0):
+                self.peak[name] = size
+        self.samples += 1
+        # Restarted once the snapshot is processed, so the interval does not include the sampling itself
+        signal.setitimer(signal.ITIMER_PROF, self.interval)
+
+    def __enter__(self) -> 'MemorySampler':
+        self.previous = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous)
+
+
+def profile(instance: Instance, max_iter: int = None, top: int = 15, folded: str = 'profile.folded',
+            stats: str = None) -> Dict[str, Tuple]:
+    """ Profile the construction and a bounded tabu search, and print the time and memory of the hot functions.
+
+    The run is executed twice: under cProfile and the stack sampler, then
+    under tracemalloc, so that neither measure slows down the other. The
+    memory of a function is the size of the blocks allocated by it and by the
+    functions it calls: the peak of the live size during the run (sampled, see
+    MemorySampler), and the size still alive at the end minus the size alive
+    at the start (retained).
+    :param max_iter: Tabu search iterations (max_iter of the instance config by default)
+    :param top:      Number of functions reported besides HOT_FUNCTIONS, by own time
+    :param folded:   File of the folded stacks for a flame graph (None to skip it)
+    :param stats:    File where the cProfile statistics are dumped, e.g. for snakeviz (None to skip it)
+    :return: calls, own time, cumulative time, peak memory and retained memory of every reported function
+    """
+    print('\n*******************************')
+    print('*           PROFILE           *')
+    print('*******************************')
+    index = FunctionIndex()
+    profiler = cProfile.Profile()
+    sampler = StackSampler()
+    if folded is not None and hasattr(signal, 'SIGPROF'):
+        with sampler:
+            solution = profiler.runcall(solve, instance, max_iter)
+    else:
+        solution = profiler.runcall(solve, instance, max_iter)
+    profile_stats = pstats.Stats(profiler)
+    total_time = profile_stats.total_tt
+    times = time_report(profile_stats, index)
+
+    memory_sampler = MemorySampler(index)
+    tracemalloc.start(25)
+    before = tracemalloc.take_snapshot()
+    if hasattr(signal, 'SIGPROF'):
+        with memory_sampler:
+            solution = solve(instance, max_iter)
+    else:
+        solution = solve(instance, max_iter)
+    after = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = memory_report(after, index, before)
+
+    others = sorted((name for name in times if name not in HOT_FUNCTIONS), key=lambda n: -times[n][1])[:top]
+    report = {}
+    print(f'Legs = {len(instance.legs)}, value = {solution.value}, time = {total_time:.3f} s, '
+          f'peak memory = {peak / 1024:.0f} KB, memory samples = {memory_sampler.samples}')
+    print(f'{"function":<45} {"calls":>9} {"own s":>8} {"own %":>6} {"cum s":>8} {"peak KB":>8} {"retained KB":>11}')
+    for name in HOT_FUNCTIONS + tuple(others):
+        calls, own, cumulative = times.get(name, (0, 0.0, 0.0))
+        peak_size = memory_sampler.peak.get(name, 0)
+        retained_size = retained.get(name, 0)
+        report[name] = (calls, own, cumulative, peak_size, retained_size)
+        share = 100 * own / total_time if total_time > 0 else 0
+        print(f'{name:<45} {calls:>9} {own:>8.3f} {share:>6.1f} {cumulative:>8.3f} {peak_size / 1024:>8.1f} '
+              f'{retained_size / 1024:>11.1f}')
+    if folded is not None and sampler.stacks:
+        sampler.write(folded)
+        print(f'Folded stacks written to {folded} ({sum(sampler.stacks.values())} samples)')
+    if stats is not None:
+        profile_stats.dump_stats(stats)
+        print(f'cProfile statistics written to {stats}')
+    print()
+    return report
@@ -0,0 +1,148 @@
+from copy import deepcopy
+from typing import Dict, Iterable, List, Union
+
+from sortedcontainers import SortedList
+
+from data import Instance, BusLeg
+from employee import Employee
+from solution import Solution
+from algorithm import Algorithm
+
+
+class Reoptimization(Algorithm):
+    """ Warm start of the search after a few legs of the instance changed (delays, cancellations, new trips).
+
+    The legs of the current solution keep their employee, except:
+        - the removed legs are dropped,
+        - a modified leg (same id, new times or positions) stays with its employee,
+          unless it increases the hard constraints of the employee,
+        - the added legs are unassigned.
+    The unassigned legs are inserted at the cheapest place (in a new employee
+    if it is cheaper), then a short tabu search restricted to the employees
+    affected by the changes and to the employees working at the same time
+    improves the schedule. The other employees keep their shift and their id.
+    After apply(), self.instance is the changed instance, so successive
+    changes can be applied to the same object.
+    """
+
+    def __init__(self, instance: Instance, max_iter: int = None, margin: int = 60, max_employees: int = 20) -> None:
+        """
+        :param instance:      Instance of the solutions given to apply()
+        :param max_iter:      Iterations of the restricted tabu search (max(10, config.max_iter // 10) by default)
+        :param margin:        Employees working within 'margin' minutes of a changed leg are also improved
+        :param max_employees: Maximum number of employees of the restricted tabu search
+        """
+        super().__init__(instance)
+        self.max_iter = max(10, self.config.max_iter // 10) if max_iter is None else max_iter
+        self.margin = margin
+        self.max_employees = max_employees
+
+    def apply(self, current_solution: Solution, added: Iterable[BusLeg] = (),
+              removed: Iterable[Union[BusLeg, int]] = (), modified: Iterable[BusLeg] = ()):
+        """
+        :param added:    New legs, with ids not used by the instance
+        :param removed:  Legs (or leg ids) to remove
+        :param modified: Legs replacing the legs of the instance with the same id
+        :return: the evaluation of the new solution and the solution
+        """
+        print('\n*******************************')
+        print('*       RE-OPTIMIZATION       *')
+        print('*******************************')
+        added = list(added)
+        removed = {leg if isinstance(leg, int) else leg.id for leg in removed}
+        modified = {leg.id: leg for leg in modified}
+        removed_legs = [leg for leg in self.instance.legs if leg.id in removed]
+        self.instance = self.update_instance(added, removed, modified)
+        legs = {leg.id: leg for leg in self.instance.legs}
+
+        employees = []
+        affected = set()
+        unassigned = list(added)
+        for e in current_solution.employees.values():
+            shift = [legs[leg.id] for leg in e.bus_legs if leg.id not in removed]
+            if not shift:
+                continue
+            changed = [leg for leg in shift if leg.id in modified]
+            if not changed and len(shift) == len(e.bus_legs):
+                # Same legs: the evaluated state is kept
+                employee = deepcopy(e)
+                employee.instance = self.instance
+                employees.append(employee)
+                continue
+            affected.add(e.id)
+            employee = Employee(e.id, self.instance)
+            employee.bus_legs.update(shift)
+            employee.evaluate()
+            if changed and employee.state.hard > e.state.hard:
+                for leg in changed:
+                    employee.bus_legs.remove(leg)
+                    unassigned.append(leg)
+                employee.evaluate()
+            if employee.bus_legs:
+                employees.append(employee)
+        solution = Solution(employees)
+        print(f'Removed legs = {len(removed)}, modified legs = {len(modified)}, added legs = {len(added)}, '
+              f'legs to insert = {len(unassigned)}')
+
+        for leg in sorted(unassigned):
+            affected.add(self.insert(solution, leg))
+        solution.refresh()
+        print(f'Repaired solution = {solution.value}')
+
+        changed_legs = unassigned + list(modified.values()) + removed_legs
+        selected = self.neighbors(solution, affected, changed_legs)
+        if len(selected) >= 2 and self.max_iter > 1:
+            print(f'Employees improved = {len(selected)}')
+            self.restricted_search(solution, selected, self.max_iter)
+        print(f'Re-optimized solution = {solution.value}')
+        print()
+        return solution.value, solution
+
+    def update_instance(self, added: List[BusLeg], removed: set, modified: Dict[int, BusLeg]) -> Instance:
+        """ Return the instance with the legs removed, modified and added """
+        ids = {leg.id for leg in self.instance.legs}
+        for leg_id in list(removed) + list(modified):
+            if leg_id not in ids:
+                raise ValueError(f'Unknown leg {leg_id}')
+        for leg in added:
+            if leg.id in ids or leg.id is None:
+                raise ValueError(f'The added leg {leg.id} needs a new id')
+            ids.add(leg.id)
+        legs = SortedList(modified.get(leg.id, leg) for leg in self.instance.legs if leg.id not in removed)
+        legs.update(added)
+        return Instance(legs, self.instance.distance_matrix, self.instance.start_work, self.instance.end_work,
+                        self.config)
+
+    def insert(self, solution: Solution, leg: BusLeg) -> int:
+        """ Assign the leg to the employee with the cheapest insertion, or to a new employee
+
+        :return: the id of the employee
+        """
+        key = self.best_insertion(solution, None, leg)
+        new_employee = Employee(max(solution.employees, default=0) + 1, self.instance)
+        new_employee.bus_legs.add(leg)
+        new_cost = new_employee.evaluate()
+        if key is None or self.insertion_cost(solution.employees[key], leg) > new_cost:
+            solution.employees[new_employee.id] = new_employee
+            return new_employee.id
+        employee = solution.employees[key]
+        employee.bus_legs.add(leg)
+        employee.evaluate()
+        return key
+
+    def neighbors(self, solution: Solution, affected: set, legs: List[BusLeg]) -> List[Employee]:
+        """ Return the affected employees, and the employees working within 'margin' of a changed leg
+            (the closest first), up to max_employees
+        """
+        selected = [solution.employees[key] for key in affected if key in solution.employees]
+        distances = {}
+        for key, e in solution.employees.items():
+            if key in affected or not e.bus_legs:
+                continue
+            distance = min((max(leg.start - e.state.end_shift, e.state.start_shift - leg.end, 0) for leg in legs),
+                           default=None)
+            if distance is not None and distance <= self.margin:
+                distances[key] = distance
+        for key in sorted(distances, key=distances.get)[:max(0, self.max_employees - len(selected))]:
+            selected.append(solution.employees[key])
+        return selected
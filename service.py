@@ -0,0 +1,550 @@
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List
+
+from sortedcontainers import SortedList
+
+from config import Config
+from data import Instance, BusLeg
+from algorithm import ConstructionAlgorithm, TabuSearch
+
+
+def instance_to_dict(instance: Instance) -> Dict:
+    """ Return the JSON compatible description of an instance accepted by the service """
+    return {
+        'legs': [[leg.id, leg.tour, leg.start, leg.end, leg.start_pos, leg.end_pos] for leg in instance.legs],
+        'distance_matrix': instance.distance_matrix,
+        'start_work': instance.start_work,
+        'end_work': instance.end_work,
+        'config': instance.config.as_dict(),
+    }
+
+
+def instance_from_dict(data: Dict) -> Instance:
+    """ Build an instance from its description.
+
+    Every leg is [id, tour, start, end, start_pos, end_pos], or
+    [tour, start, end, start_pos, end_pos] with ids numbered from 1 as in Instance.read_data.
+    The optional 'config' holds the parameters of the run that differ from the defaults (see Config),
+    the environment of the service is not used.
+    :raise ValueError: if the description is not a valid instance
+    """
+    if not isinstance(data, dict):
+        raise ValueError('The instance must be an object')
+    try:
+        start_work = [int(x) for x in data['start_work']]
+        end_work = [int(x) for x in data['end_work']]
+        positions = len(start_work)
+        distance_matrix = [[int(x) for x in row] for row in data['distance_matrix']]
+        if len(end_work) != positions or len(distance_matrix) != positions or \
+                any(len(row) != positions for row in distance_matrix):
+            raise ValueError(f'start_work, end_work and distance_matrix must all have {positions} positions')
+        legs = SortedList()
+        ids = set()
+        for k, row in enumerate(data['legs']):
+            if len(row) == 5:
+                row = [k + 1] + list(row)
+            if len(row) != 6:
+                raise ValueError(f'Leg {k} must have 5 or 6 fields')
+            leg = BusLeg(*[int(x) for x in row])
+            if leg.id in ids:
+                raise ValueError(f'Duplicate leg id {leg.id}')
+            if not (0 <= leg.start_pos < positions and 0 <= leg.end_pos < positions):
+                raise ValueError(f'Leg {leg.id} has a position out of range')
+            if leg.end < leg.start:
+                raise ValueError(f'Leg {leg.id} ends before it starts')
+            ids.add(leg.id)
+            legs.add(leg)
+        config = data.get('config') or {}
+        if not isinstance(config, dict):
+            raise ValueError('The config must be an object')
+    except KeyError as e:
+        raise ValueError(f'Missing field {e}') from None
+    except TypeError as e:
+        raise ValueError(f'Invalid instance: {e}') from None
+    return Instance(legs, distance_matrix, start_work, end_work, Config.from_dict(config))
+
+
+def solve_job(job_id: str, data: Dict, max_iter: int, events, cancel) -> Dict:
+    """ Run the construction algorithm and the tabu search on an instance.
+
+    This is the job executed by the worker processes. Progress is put on the
+    'events' queue as (job_id, event), followed by (job_id, None) once the
+    job is over. The tabu search stops at the next iteration when 'cancel' is
+    set and the best solution found so far is returned.
+    """
+    try:
+        # The algorithms print their progress, which would mix with the output of the front ends
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            instance = instance_from_dict(data)
+            # The seed is returned with the result, so that the job can be run again with the same output
+            instance.config = instance.config.with_seed()
+            solution = ConstructionAlgorithm(instance).apply()
+            solution.evaluate(instance)
+            events.put((job_id, {'stage': 'construction', 'value': solution.value}))
+            best = [solution.value]
+
+            def callback(iteration, value, best_value):
+                if best_value < best[0]:
+                    best[0] = best_value
+                    events.put((job_id, {'stage': 'tabu_search', 'iteration': iteration, 'value': value,
+                                         'best': best_value}))
+                return cancel.is_set()
+
+            if not cancel.is_set():
+                best_objective, solution = TabuSearch(instance, max_iter=max_iter, callback=callback).apply(solution)
+            solution = solution.removeEmptyEmployees()
+            return {'value': solution.value, 'hard': solution.hard, 'soft': solution.soft,
+                    'shifts': solution.shifts(), 'cancelled': cancel.is_set(), 'seed': instance.config.seed}
+    finally:
+        events.put((job_id, None))
+
+
+class Job:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    CANCELLED = 'cancelled'
+    FAILED = 'failed'
+
+    def __init__(self, id: str, data: Dict, max_iter: int, legs: int) -> None:
+        self.id = id
+        self.data = data
+        self.legs = legs
+        self.max_iter = max_iter
+        self.status = Job.QUEUED
+        self.events = []
+        self.result = None
+        self.error = None
+        self.cancel_event = None
+        self.task = None
+        self.changed = asyncio.Condition()
+        self.drained = asyncio.Event()
+        self.done = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.done.is_set()
+
+    def info(self, result: bool = False) -> Dict:
+        info = {'id': self.id, 'status': self.status, 'legs': self.legs}
+        if self.events:
+            info['progress'] = self.events[-1]
+        if self.error is not None:
+            info['error'] = self.error
+        if result and self.result is not None:
+            info['result'] = self.result
+        return info
+
+
+class JobService:
+    """ In-process service solving instances on a pool of worker processes.
+
+    Jobs wait in a bounded queue until one of the 'max_concurrent' slots is
+    free, then ConstructionAlgorithm + TabuSearch run in a worker process,
+    so the modules are loaded once per worker and not once per request.
+    Only the last 'max_finished' finished jobs are kept, with their instance
+    and result, older ones are dropped (see also forget).
+
+        async with JobService(workers=4) as service:
+            job_id = await service.submit(instance_to_dict(instance))
+            async for event in service.stream(job_id):
+                print(event)
+            info = await service.result(job_id)
+    """
+
+    def __init__(self, workers: int = None, max_concurrent: int = None, max_queue: int = 100,
+                 max_iter: int = None, max_finished: int = 1000) -> None:
+        """
+        :param workers:        Number of worker processes (number of CPUs by default)
+        :param max_concurrent: Maximum number of jobs running at the same time (number of workers by default)
+        :param max_queue:      Maximum number of queued jobs, submit raises asyncio.QueueFull beyond it
+        :param max_iter:       Default number of tabu search iterations of a job (max_iter of its config by default)
+        :param max_finished:   Maximum number of finished jobs kept, the oldest ones are dropped
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or self.workers
+        self.max_queue = max_queue
+        self.max_iter = max_iter
+        self.max_finished = max_finished
+        self.jobs = {}
+        # Ids of the finished jobs still kept, in the order they finished
+        self.finished = {}
+        self.ids = itertools.count(1)
+        self.executor = None
+        self.manager = None
+        self.events = None
+        self.reader = None
+        self.semaphore = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        # The workers are forked with the first task: they would inherit the connections open at that time
+        # and keep them open after the replies, so they are started before the front ends accept any
+        await loop.run_in_executor(self.executor, os.getpid)
+        self.manager = multiprocessing.Manager()
+        self.events = self.manager.Queue()
+        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.reader = loop.create_task(self.read_events())
+
+    async def close(self) -> None:
+        """ Cancel the unfinished jobs, wait for the running ones and stop the workers """
+        for job in list(self.jobs.values()):
+            self.cancel(job.id)
+        tasks = [job.task for job in self.jobs.values() if job.task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.events.put(None)
+        await self.reader
+        self.executor.shutdown()
+        self.manager.shutdown()
+
+    async def __aenter__(self) -> 'JobService':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == Job.QUEUED)
+
+    async def submit(self, data: Dict, max_iter: int = None) -> str:
+        """ Queue a job solving the instance described by 'data' (see instance_from_dict)
+
+        :return: the id of the job
+        :raise ValueError: if 'data' is not a valid instance, the job is not queued
+        """
+        if self.queued >= self.max_queue:
+            raise asyncio.QueueFull(f'{self.max_queue} jobs are already queued')
+        instance = instance_from_dict(data)
+        if max_iter is not None and (not isinstance(max_iter, int) or max_iter < 1):
+            raise ValueError(f'Invalid max_iter {max_iter!r}')
+        job = Job(str(next(self.ids)), data, self.max_iter if max_iter is None else max_iter, len(instance.legs))
+        self.jobs[job.id] = job
+        job.task = asyncio.get_running_loop().create_task(self.run(job))
+        return job.id
+
+    async def run(self, job: Job) -> None:
+        async with self.semaphore:
+            if job.finished:
+                # Cancelled while queued
+                return
+            loop = asyncio.get_running_loop()
+            job.cancel_event = self.manager.Event()
+            job.status = Job.RUNNING
+            await self.notify(job)
+            try:
+                result = await loop.run_in_executor(self.executor, solve_job, job.id, job.data, job.max_iter,
+                                                    self.events, job.cancel_event)
+            except Exception as e:
+                job.error = f'{type(e).__name__}: {e}'
+                await self.finish(job, Job.FAILED)
+                return
+            # The last progress events may still be in the queue
+            await job.drained.wait()
+            job.result = result
+            await self.finish(job, Job.CANCELLED if result['cancelled'] else Job.DONE)
+
+    async def read_events(self) -> None:
+        """ Dispatch the progress events sent by the workers to their jobs """
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(None, self.events.get)
+            if item is None:
+                return
+            job_id, event = item
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            if event is None:
+                job.drained.set()
+            else:
+                job.events.append(event)
+                await self.notify(job)
+
+    async def notify(self, job: Job) -> None:
+        async with job.changed:
+            job.changed.notify_all()
+
+    async def finish(self, job: Job, status: str) -> None:
+        job.status = status
+        self.retire(job)
+        await self.notify(job)
+
+    def retire(self, job: Job) -> None:
+        """ Mark a job as over, and drop the oldest finished jobs beyond max_finished """
+        job.done.set()
+        self.finished[job.id] = None
+        while len(self.finished) > self.max_finished:
+            job_id = next(iter(self.finished))
+            del self.finished[job_id]
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Job:
+        if job_id not in self.jobs:
+            raise KeyError(f'Unknown job {job_id}')
+        return self.jobs[job_id]
+
+    def status(self, job_id: str) -> Dict:
+        return self.get(job_id).info()
+
+    def list(self) -> List[Dict]:
+        return [job.info() for job in self.jobs.values()]
+
+    async def result(self, job_id: str) -> Dict:
+        """ Wait for the end of a job and return its status with the solution """
+        job = self.get(job_id)
+        await job.done.wait()
+        return job.info(result=True)
+
+    async def stream(self, job_id: str) -> AsyncIterator[Dict]:
+        """ Yield the progress events of a job until it is over, then its final status """
+        job = self.get(job_id)
+        k = 0
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(lambda: len(job.events) > k or job.finished)
+                events = job.events[k:]
+            for event in events:
+                yield event
+            k += len(events)
+            if job.finished and k == len(job.events):
+                yield {'status': job.status}
+                return
+
+    def cancel(self, job_id: str) -> bool:
+        """ Cancel a queued job, or stop the search of a running job (its best solution is kept)
+
+        :return: False if the job was already over
+        """
+        job = self.get(job_id)
+        if job.finished:
+            return False
+        if job.status == Job.QUEUED:
+            job.status = Job.CANCELLED
+            self.retire(job)
+            asyncio.get_running_loop().create_task(self.notify(job))
+        else:
+            job.cancel_event.set()
+        return True
+
+    def forget(self, job_id: str) -> bool:
+        """ Drop a finished job
+
+        :return: False if the job is not over
+        """
+        if not self.get(job_id).finished:
+            return False
+        del self.jobs[job_id]
+        self.finished.pop(job_id, None)
+        return True
+
+
+class HttpFrontEnd:
+    """ Minimal HTTP/1.1 front end of a JobService (one request per connection).
+
+        POST   /jobs              {"instance": {...}, "max_iter": n}  -> {"id": ...}
+        GET    /jobs                                                  -> status of every job
+        GET    /jobs/<id>                                             -> status
+        GET    /jobs/<id>/result                                      -> waits for the solution
+        GET    /jobs/<id>/events                                      -> progress, one JSON object per line
+        DELETE /jobs/<id>                                             -> cancel
+        DELETE /jobs/<id>?forget                                      -> drop a finished job
+    """
+
+    REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               409: 'Conflict', 429: 'Too Many Requests', 500: 'Internal Server Error'}
+
+    def __init__(self, service: JobService, host: str = '127.0.0.1', port: int = 8080) -> None:
+        self.service = service
+        self.host = host
+        self.port = port
+
+    async def serve(self) -> None:
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f'Listening on http://{self.host}:{self.port}', file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                length = -1
+            if len(request_line) < 2 or length < 0:
+                await self.respond(writer, 400, {'error': 'Malformed request'})
+                return
+            body = await reader.readexactly(length)
+            target, _, query = request_line[1].partition('?')
+            await self.route(writer, request_line[0], target.strip('/').split('/'), body, query.split('&'))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            # The client gets an answer, and the service keeps serving the other ones
+            with contextlib.suppress(Exception):
+                await self.respond(writer, 500, {'error': f'{type(e).__name__}: {e}'})
+        finally:
+            writer.close()
+
+    async def route(self, writer: asyncio.StreamWriter, method: str, path: List[str], body: bytes,
+                    query: List[str] = ()) -> None:
+        service = self.service
+        if path[0] != 'jobs' or len(path) > 3:
+            await self.respond(writer, 404, {'error': 'Not found'})
+            return
+        if len(path) == 1:
+            if method == 'GET':
+                await self.respond(writer, 200, service.list())
+            elif method == 'POST':
+                try:
+                    request = json.loads(body)
+                    job_id = await service.submit(request['instance'], request.get('max_iter'))
+                except (ValueError, KeyError, TypeError) as e:
+                    await self.respond(writer, 400, {'error': f'Invalid job: {e}'})
+                except asyncio.QueueFull as e:
+                    await self.respond(writer, 429, {'error': str(e)})
+                else:
+                    await self.respond(writer, 202, {'id': job_id})
+            else:
+                await self.respond(writer, 405, {'error': 'Method not allowed'})
+            return
+        if path[1] not in service.jobs:
+            await self.respond(writer, 404, {'error': f'Unknown job {path[1]}'})
+            return
+        action = path[2] if len(path) == 3 else None
+        if method == 'DELETE' and action is None and 'forget' in query:
+            status = service.status(path[1])
+            forgotten = service.forget(path[1])
+            await self.respond(writer, 200 if forgotten else 409, status)
+        elif method == 'DELETE' and action is None:
+            cancelled = service.cancel(path[1])
+            await self.respond(writer, 200 if cancelled else 409, service.status(path[1]))
+        elif method != 'GET':
+            await self.respond(writer, 405, {'error': 'Method not allowed'})
+        elif action is None:
+            await self.respond(writer, 200, service.status(path[1]))
+        elif action == 'result':
+            await self.respond(writer, 200, await service.result(path[1]))
+        elif action == 'events':
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nConnection: close\r\n\r\n')
+            async for event in service.stream(path[1]):
+                writer.write(json.dumps(event).encode() + b'\n')
+                await writer.drain()
+        else:
+            await self.respond(writer, 404, {'error': 'Not found'})
+
+    async def respond(self, writer: asyncio.StreamWriter, code: int, content) -> None:
+        body = json.dumps(content).encode()
+        writer.write(f'HTTP/1.1 {code} {self.REASONS[code]}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+        await writer.drain()
+
+
+class StdioFrontEnd:
+    """ JSON lines front end of a JobService on stdin/stdout.
+
+    Every request is a JSON object with an "op" and an optional "ref" copied in the reply:
+        {"op": "submit", "instance": {...}, "max_iter": n, "stream": true}
+        {"op": "status", "id": ...}
+        {"op": "result", "id": ...}    (replies once the job is over)
+        {"op": "cancel", "id": ...}
+        {"op": "forget", "id": ...}    (drops a finished job)
+        {"op": "list"}
+    With "stream", the progress events of the job are written as {"id": ..., "event": {...}}.
+    The service is closed at the end of stdin.
+    """
+
+    def __init__(self, service: JobService) -> None:
+        self.service = service
+        self.tasks = set()
+
+    def write(self, content: Dict) -> None:
+        sys.stdout.write(json.dumps(content) + '\n')
+        sys.stdout.flush()
+
+    async def serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                self.write({'error': f'Invalid JSON: {e}'})
+                continue
+            task = loop.create_task(self.handle(request))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def handle(self, request: Dict) -> None:
+        service = self.service
+        reply = {'ref': request['ref']} if 'ref' in request else {}
+        op = request.get('op')
+        try:
+            if op == 'submit':
+                job_id = await service.submit(request['instance'], request.get('max_iter'))
+                self.write({**reply, 'id': job_id})
+                if request.get('stream'):
+                    async for event in service.stream(job_id):
+                        self.write({'id': job_id, 'event': event})
+            elif op == 'status':
+                self.write({**reply, **service.status(request['id'])})
+            elif op == 'result':
+                self.write({**reply, **await service.result(request['id'])})
+            elif op == 'cancel':
+                self.write({**reply, 'cancelled': service.cancel(request['id'])})
+            elif op == 'forget':
+                self.write({**reply, 'forgotten': service.forget(request['id'])})
+            elif op == 'list':
+                self.write({**reply, 'jobs': service.list()})
+            else:
+                self.write({**reply, 'error': f'Unknown op {op}'})
+        except (ValueError, KeyError, TypeError, asyncio.QueueFull) as e:
+            self.write({**reply, 'error': f'{type(e).__name__}: {e}'})
+
+
+async def serve(args) -> None:
+    async with JobService(args.workers, args.max_concurrent, args.max_queue, args.max_iter,
+                          args.max_finished) as service:
+        if args.stdio:
+            await StdioFrontEnd(service).serve()
+        else:
+            await HttpFrontEnd(service, args.host, args.port).serve()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bus driver scheduling job service')
+    parser.add_argument('--stdio', action='store_true', help='Read JSON lines requests on stdin instead of HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--max-concurrent', type=int, default=None, help='Maximum number of running jobs')
+    parser.add_argument('--max-queue', type=int, default=100, help='Maximum number of queued jobs')
+    parser.add_argument('--max-iter', type=int, default=None, help='Default tabu search iterations of a job')
+    parser.add_argument('--max-finished', type=int, default=1000, help='Maximum number of finished jobs kept')
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -1,13 +1,23 @@
 import csv
-import os
-import numpy as np
-import time
-from sortedcontainers import SortedList
 
-import config as conf
 from data import Instance, BusLeg
-from typing import List
-from employee import Employee
+from typing import List, Tuple
+from employee import Employee, EmployeeOverlay
+
+
+MASK_64 = (1 << 64) - 1
+
+
+def zobrist_key(leg_id: int, employee_id: int) -> int:
+    """ Return the 64 bits random key of the assignment of a leg to an employee.
+
+    The keys are computed with the splitmix64 mixing function instead of being
+    stored in a table, so they are the same in every process.
+    """
+    x = (((leg_id << 32) ^ employee_id) + 0x9E3779B97F4A7C15) & MASK_64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return x ^ (x >> 31)
 
 
 class Solution:
@@ -16,28 +26,126 @@ class Solution:
         self.employees = {employee.id: employee for employee in employees}
         self.value = 0
         self.change = 0
+        self.hash = self.compute_hash()
+        # Running totals, kept up to date with value
+        self.hard = 0
+        self.soft = 0
+        self.feasible = 0
+        # Weighted totals of every constraint, (name, category) -> total, updated by the accepted moves only
+        self.totals = {}
+        # (i, j, previous state of i, previous state of j) of the last move, until it is committed
+        self.pending = None
 
     def copy(self):
+        self.commit()
         employees_copy = [e.copy() for e in self.employees.values()]
         output = Solution(employees_copy)
         output.value = self.value
+        output.hard = self.hard
+        output.soft = self.soft
+        output.feasible = self.feasible
+        output.totals = self.totals.copy()
         return output
 
+    @property
+    def multi_value(self) -> Tuple[int, int]:
+        """ Return (hard, soft), to compare solutions lexicographically """
+        return self.hard, self.soft
+
+    def account(self, employee: Employee, sign: int) -> None:
+        """ Add (sign=1) or remove (sign=-1) the current state of 'employee' from the running totals """
+        state = employee.state
+        self.hard += sign * state.hard
+        self.soft += sign * state.soft
+        if state.hard == 0 and state.constraints:
+            self.feasible += sign
+
+    def count(self, state, sign: int) -> None:
+        """ Add (sign=1) or remove (sign=-1) the constraints of 'state' from the constraint totals """
+        totals = self.totals
+        for con in state.constraints:
+            key = (con.name, con.category)
+            totals[key] = totals.get(key, 0) + sign * con.weight * con.value
+
+    def commit(self) -> None:
+        """ Count the last move in the constraint totals, once it is known that it was not reverted.
+
+        The moves evaluated and reverted by the search never reach the totals:
+        a move is committed when the next one is evaluated, or when the totals are read.
+        """
+        if self.pending is None:
+            return
+        i, j, previous_i, previous_j = self.pending
+        self.pending = None
+        self.count(previous_i, -1)
+        self.count(previous_j, -1)
+        self.count(self.employees[i].state, 1)
+        self.count(self.employees[j].state, 1)
+
+    @property
+    def constraint_totals(self) -> dict:
+        """ Return the weighted sum of every constraint over the employees, (name, category) -> total """
+        self.commit()
+        return self.totals
+
+    def reevaluate(self, key: int) -> float:
+        """ Evaluate again the employee 'key' after a change of its legs, and update the evaluation """
+        self.commit()
+        employee = self.employees[key]
+        self.value -= employee.objective
+        self.account(employee, -1)
+        self.count(employee.state, -1)
+        self.value += employee.evaluate()
+        self.account(employee, 1)
+        self.count(employee.state, 1)
+        return self.value
+
+    def compute_hash(self) -> int:
+        """ Return the Zobrist hash of the assignment leg -> employee: the xor of the keys of every assignment """
+        h = 0
+        for key, employee in self.employees.items():
+            for leg in employee.bus_legs:
+                h ^= zobrist_key(leg.id, key)
+        return h
+
     def evaluate(self, instance: Instance) -> float:
         """ Evaluate the current solution.
 
         :return: the sum of every employee objective
         """
         self.value = 0
+        self.hard = 0
+        self.soft = 0
+        self.feasible = 0
+        self.totals = {}
+        self.pending = None
         for key, employee in self.employees.items():
             # self.evaluation += sum(employee.evaluate().values())
             self.value += employee.evaluate()
+            self.account(employee, 1)
+            self.count(employee.state, 1)
+        self.hash = self.compute_hash()
+        return self.value
+
+    def refresh(self) -> float:
+        """ Compute the evaluation, the running totals and the hash from the current states of the employees,
+            without evaluating them again (they must be evaluated)
+        """
+        self.value = 0
+        self.hard = 0
+        self.soft = 0
+        self.feasible = 0
+        self.totals = {}
+        self.pending = None
+        for employee in self.employees.values():
+            self.value += employee.objective
+            self.account(employee, 1)
+            self.count(employee.state, 1)
+        self.hash = self.compute_hash()
         return self.value
 
     def print_objective(self) -> None:
         print('\nCONSTRAINTS:')
-        hard_constraints = 0
-        soft_constraints = 0
         print('\nPROPERTIES:')
         for key, e in self.employees.items():
             print(' '+e.name+':')
@@ -52,12 +160,18 @@ class Solution:
             print('  shift_split:', e.state.split)
         print('\nCONSTRAINTS:')
         for key, e in self.employees.items():
-            print(f'  {e.name}: MultiValue({e.state.MultiValue})')
-            hard_constraints += e.state.MultiValue[0]
-            soft_constraints += e.state.MultiValue[1]
+            print(f'  {e.name}: MultiValue({ {0: e.state.hard, 1: e.state.soft} })')
             for constraint in e.state.constraints:
                 constraint.print_con()
-        MultiValue = {0: hard_constraints, 1: soft_constraints}
+        self.print_totals()
+
+    def print_totals(self) -> None:
+        """ Print the running totals, without evaluating the employees """
+        print('\nTOTALS:')
+        for (name, category), total in self.constraint_totals.items():
+            print(f'  {name} ({category}): {int(total)}')
+        print(f'  feasible employees: {self.feasible}/{sum(1 for e in self.employees.values() if e.bus_legs)}')
+        MultiValue = {0: self.hard, 1: self.soft}
         print(f' \nvalue: MultiValue:({MultiValue})')
 
     def print_to_file(self) -> None:
@@ -80,47 +194,14 @@ class Solution:
                 writer.writerow(data[key-1])
         csv_file.close()
 
-    def visualize_solution(self):
-        break_counter = 0
-        for i, e in self.employees.items():
-            a = e.start_shift + 2*60
-            b = e.end_shift - 2*60
-            if e.working_constraints.break30 is True and e.working_constraints.first15 is True:
-                for k in range(0, len(e.bus_legs)-1):
-                    leg_i = e.bus_legs[k]
-                    leg_j = e.bus_legs[k+1]
-                    i = int(leg_i.end_pos)
-                    j = int(leg_j.start_pos)
-                    r = e.passive_ride(i, j)
-                    if r > 0:
-                        Ride = BusLeg(None, 'R', leg_j.start - r, leg_j.start, 0, 0)
-                        e.bus_legs.append(Ride)
-                    # leg_j.start -= r 
-                    if leg_i.end < a:
-                        end_break = int(min(a, leg_j.start - r))
-                        if end_break - leg_i.end  >= 15:
-                            Paid = BusLeg(None, 'P', leg_i.end, end_break, 0, 0) 
-                            e.bus_legs.append(Paid)
-                    if leg_j.start > b:
-                        start_break = max(b, leg_i.end)
-                        if leg_j.start - start_break >= 15:
-                            Paid = BusLeg(None, 'P', start_break, leg_j.start, 0, 0) 
-                            e.bus_legs.append(Paid)
-                    if a < leg_i.end  and leg_j.start - r < b:
-                        end_break = int(min(a, leg_j.start - r))
-                        if end_break - leg_i.end >= 15:
-                            Unpaid = BusLeg(None, 'U', leg_i.end, end_break, 0, 0) 
-                            e.bus_legs.append(Unpaid)
-
-            if e.start_shift != e.start_fs:
-                start = BusLeg(None, 'S', e.start_shift, e.start_fs, 0, 0)
-                start.name = 'Start'
-                e.bus_legs.insert(0, start)
-            if e.end_shift != e.end_ls:
-                end = BusLeg(None, 'E', e.end_ls, e.end_shift, 0, 0)
-                end.name = 'End'
-                e.bus_legs.append(end)
-  
+    def overlays(self) -> List[EmployeeOverlay]:
+        """ Return the rows visualizing the non empty employees with their rides, breaks, start and end of work.
+
+        The overlay intervals are generated when a row is iterated (see Employee.overlay),
+        the solution is not modified.
+        """
+        return [EmployeeOverlay(e) for e in self.employees.values() if e.bus_legs]
+
     @staticmethod
     def construct_solution(instance: Instance, matrix: List):
         """ Construct a solution.
@@ -141,12 +222,33 @@ class Solution:
         solution = Solution(employees)
         return solution
 
-    def execute_move(self, i: int, j: int, leg: BusLeg) -> float:
+    @staticmethod
+    def construct_from_shifts(instance: Instance, shifts: List[List[int]]):
+        """ Construct a solution from the leg ids of every employee.
+
+        :param shifts: a list of n lists of leg ids
+        :return solution: the employees are numbered by the start of their first leg
+        """
+        legs = {leg.id: leg for leg in instance.legs}
+        employees = []
+        for shift in sorted(shifts, key=lambda s: legs[s[0]].start):
+            employee = Employee(len(employees) + 1, instance)
+            employee.bus_legs.update(legs[leg_id] for leg_id in shift)
+            employees.append(employee)
+        return Solution(employees)
+
+    def shifts(self) -> List[List[int]]:
+        """ Return the leg ids of every non empty employee """
+        return [[leg.id for leg in e.bus_legs] for e in self.employees.values() if e.bus_legs]
+
+    def execute_move(self, i: int, j: int, leg: BusLeg, cutoff: float = None) -> float:
         """ Execute the move  [e_i, e_j, leg].
 
         :param i:   Index of first employee e1
         :param j:   Index of second employee e2
         :param leg: Leg that is removed from i, and added to j 
+        :param cutoff: if given, stop the evaluation as soon as the new evaluation is known to be at least cutoff.
+        The returned evaluation is then only a lower bound, and the move must be reverted.
         :return: the new evaluation after executing the move
         if new_e1, new_e2 are the new employeers, the change is
             change = - z(old_e1) - z(old_e2) + z(new_e1) + z(new_e2)
@@ -155,14 +257,52 @@ class Solution:
         """
         self.employees[i].bus_legs.remove(leg)
         self.employees[j].bus_legs.add(leg)
-        self.change = -(self.employees[i].objective + self.employees[j].objective)
+        self.hash ^= zobrist_key(leg.id, i) ^ zobrist_key(leg.id, j)
         # self.change += sum(self.employees[i].evaluate().values())
         # self.change += sum(self.employees[j].evaluate().values())
-        self.change += self.employees[i].evaluate()
-        self.change += self.employees[j].evaluate()
-        self.value += self.change
+        self.evaluate_pair(i, j, cutoff)
         return self.value
 
+    def evaluate_pair(self, i: int, j: int, cutoff: float = None) -> None:
+        """ Evaluate again the employees i and j after a move and update the evaluation.
+
+        The objectives of the employees are not negative, so e1 cannot make the
+        solution reach cutoff if
+            z(new_e1) < cutoff - (oldEval - z(old_e1) - z(old_e2))
+        and e2 is evaluated with what remains of the cutoff.
+        The constraint totals are updated by commit(), if the move is not reverted.
+        """
+        self.commit()
+        employee_i = self.employees[i]
+        employee_j = self.employees[j]
+        self.pending = (i, j, employee_i.state, employee_j.state)
+        self.account(employee_i, -1)
+        self.account(employee_j, -1)
+        self.change = -(employee_i.objective + employee_j.objective)
+        if cutoff is None:
+            self.change += employee_i.evaluate()
+            self.change += employee_j.evaluate()
+        else:
+            base = self.value + self.change
+            self.change += employee_i.evaluate(cutoff - base)
+            self.change += employee_j.evaluate(cutoff - base - employee_i.objective)
+        self.account(employee_i, 1)
+        self.account(employee_j, 1)
+        self.value += self.change
+
+    def revert_pair(self, i: int, j: int) -> None:
+        """ Restore the previous state of the employees i and j and the evaluation """
+        employee_i = self.employees[i]
+        employee_j = self.employees[j]
+        self.account(employee_i, -1)
+        self.account(employee_j, -1)
+        employee_i.revert()
+        employee_j.revert()
+        self.account(employee_i, 1)
+        self.account(employee_j, 1)
+        self.value -= self.change
+        self.pending = None
+
     def revert(self, i: int, j: int, leg: BusLeg) -> None:
         """ Revert the move [e_i, e_j, leg] previously done.
 
@@ -173,18 +313,76 @@ class Solution:
         """
 
         self.employees[i].bus_legs.add(leg)
-        self.employees[i].revert()
         self.employees[j].bus_legs.remove(leg)
-        self.employees[j].revert()
-        self.value-= self.change
+        self.hash ^= zobrist_key(leg.id, i) ^ zobrist_key(leg.id, j)
+        self.revert_pair(i, j)
+        return self.value
+
+    def execute_exchange(self, i: int, j: int, legs_i: List[BusLeg], legs_j: List[BusLeg],
+                         cutoff: float = None) -> float:
+        """ Execute the move [e_i, e_j, legs_i, legs_j].
+
+        :param i:      Index of first employee e1
+        :param j:      Index of second employee e2
+        :param legs_i: Legs that are removed from i, and added to j
+        :param legs_j: Legs that are removed from j, and added to i
+        :param cutoff: see execute_move
+        :return: the new evaluation after executing the move
+        Only e1 and e2 are evaluated again, as in execute_move.
+        """
+        employee_i = self.employees[i]
+        employee_j = self.employees[j]
+        for leg in legs_i:
+            employee_i.bus_legs.remove(leg)
+        for leg in legs_j:
+            employee_j.bus_legs.remove(leg)
+        employee_i.bus_legs.update(legs_j)
+        employee_j.bus_legs.update(legs_i)
+        self.hash ^= self.exchange_hash(i, j, legs_i, legs_j)
+        self.evaluate_pair(i, j, cutoff)
+        return self.value
+
+    def revert_exchange(self, i: int, j: int, legs_i: List[BusLeg], legs_j: List[BusLeg]) -> float:
+        """ Revert the move [e_i, e_j, legs_i, legs_j] previously done.
+
+        :return: the old evaluation, after reverting the move
+        """
+        employee_i = self.employees[i]
+        employee_j = self.employees[j]
+        for leg in legs_j:
+            employee_i.bus_legs.remove(leg)
+        for leg in legs_i:
+            employee_j.bus_legs.remove(leg)
+        employee_i.bus_legs.update(legs_i)
+        employee_j.bus_legs.update(legs_j)
+        self.hash ^= self.exchange_hash(i, j, legs_i, legs_j)
+        self.revert_pair(i, j)
         return self.value
 
+    @staticmethod
+    def exchange_hash(i: int, j: int, legs_i: List[BusLeg], legs_j: List[BusLeg]) -> int:
+        """ Return the change of the hash made by the move [e_i, e_j, legs_i, legs_j] (it is its own inverse) """
+        h = 0
+        for leg in legs_i:
+            h ^= zobrist_key(leg.id, i) ^ zobrist_key(leg.id, j)
+        for leg in legs_j:
+            h ^= zobrist_key(leg.id, i) ^ zobrist_key(leg.id, j)
+        return h
+
     def removeEmptyEmployees(self):
-        """ Remove all the employees tha has empty bus legs """
+        """ Remove all the employees tha has empty bus legs.
+        Empty employees do not count in the evaluation, so it is kept.
+        """
         employees = []
         for key, employee in self.employees.items():
-            if employee.objective > 0:
+            if employee.bus_legs:
                 employees.append(employee)
-        outputSolution = Solution(employee)
+        self.commit()
+        outputSolution = Solution(employees)
+        outputSolution.value = self.value
+        outputSolution.hard = self.hard
+        outputSolution.soft = self.soft
+        outputSolution.feasible = self.feasible
+        outputSolution.totals = self.totals.copy()
         return outputSolution
         
\ No newline at end of file
@@ -0,0 +1,175 @@
+from collections import Counter, OrderedDict, deque
+from typing import Hashable, Iterable, List
+
+from neighborhood import Move
+from solution import Solution
+
+
+class TabuAttribute:
+    """ Definition of the attributes stored in the tabu memory.
+
+    destroyed() is called before the chosen move is executed: its keys become tabu.
+    created() is called while the move is executed: the move is tabu if one of its keys is tabu.
+    """
+
+    name = 'attribute'
+
+    def created(self, move: Move, solution: Solution) -> Iterable[Hashable]:
+        raise NotImplementedError
+
+    def destroyed(self, move: Move, solution: Solution) -> Iterable[Hashable]:
+        raise NotImplementedError
+
+
+class LegEmployeeAttribute(TabuAttribute):
+    """ A leg taken from an employee cannot be given back to it. """
+
+    name = 'leg_employee'
+
+    def created(self, move: Move, solution: Solution) -> Iterable[Hashable]:
+        return [(self.name, employee, leg_id) for employee, leg_id in move.attributes()]
+
+    def destroyed(self, move: Move, solution: Solution) -> Iterable[Hashable]:
+        return [(self.name, employee, leg_id) for employee, leg_id in move.reverse_attributes()]
+
+
+class LegPairAttribute(TabuAttribute):
+    """ Two consecutive legs of an employee separated by a move cannot be consecutive again. """
+
+    name = 'leg_pair'
+
+    def pairs(self, solution: Solution, employee: int, legs) -> List[Hashable]:
+        bus_legs = solution.employees[employee].bus_legs
+        keys = []
+        for leg in legs:
+            k = bus_legs.index(leg)
+            if k > 0:
+                keys.append((self.name, bus_legs[k-1].id, leg.id))
+            if k < len(bus_legs) - 1:
+                keys.append((self.name, leg.id, bus_legs[k+1].id))
+        return keys
+
+    def created(self, move: Move, solution: Solution) -> Iterable[Hashable]:
+        return self.pairs(solution, move.j, move.legs_out) + self.pairs(solution, move.i, move.legs_in)
+
+    def destroyed(self, move: Move, solution: Solution) -> Iterable[Hashable]:
+        return self.pairs(solution, move.i, move.legs_out) + self.pairs(solution, move.j, move.legs_in)
+
+
+class SolutionHashAttribute(TabuAttribute):
+    """ A solution left by a move cannot be visited again. """
+
+    name = 'solution'
+
+    def key(self, solution: Solution) -> Hashable:
+        return self.name, solution.hash
+
+    def created(self, move: Move, solution: Solution) -> Iterable[Hashable]:
+        return [self.key(solution)]
+
+    def destroyed(self, move: Move, solution: Solution) -> Iterable[Hashable]:
+        return [self.key(solution)]
+
+
+class TabuMemory:
+    """ Sparse tabu memory.
+
+    Tabu keys are stored in a dictionary with the iteration they expire,
+    and a queue of the keys added at every iteration removes them once
+    expired, so the size of the memory depends on the tenure and not on the
+    number of employees and legs.
+    The frequency of the attributes created by the executed moves is kept as
+    long term memory: with diversification > 0 non improving moves are
+    penalized by the frequency of their attributes.
+    """
+
+    def __init__(self, attributes: List[TabuAttribute], tenure: int, diversification: float = 0) -> None:
+        self.attributes = attributes
+        self.tenure = tenure
+        self.diversification = diversification
+        self.expiry = {}
+        self.queue = deque()
+        self.frequency = Counter()
+        self.moves = 0
+
+    def reset(self) -> None:
+        self.expiry.clear()
+        self.queue.clear()
+        self.frequency.clear()
+        self.moves = 0
+
+    def __len__(self) -> int:
+        return len(self.expiry)
+
+    def purge(self, iteration: int) -> None:
+        """ Remove the keys expired before 'iteration' """
+        while self.queue and self.queue[0][0] < iteration:
+            expiry, keys = self.queue.popleft()
+            for key in keys:
+                if self.expiry.get(key) == expiry:
+                    del self.expiry[key]
+
+    def is_tabu(self, move: Move, solution: Solution, iteration: int) -> bool:
+        """ Check if the executed move creates a tabu attribute """
+        for attribute in self.attributes:
+            for key in attribute.created(move, solution):
+                if self.expiry.get(key, -1) >= iteration:
+                    return True
+        return False
+
+    def add(self, move: Move, solution: Solution, iteration: int) -> None:
+        """ Make tabu the attributes destroyed by the move, called before executing it """
+        self.purge(iteration)
+        expiry = iteration + self.tenure
+        keys = [key for attribute in self.attributes for key in attribute.destroyed(move, solution)]
+        for key in keys:
+            self.expiry[key] = expiry
+        self.queue.append((expiry, keys))
+
+    def visit(self, move: Move, solution: Solution) -> None:
+        """ Count the attributes created by the move, called after executing it """
+        self.moves += 1
+        if self.diversification > 0:
+            self.frequency.update(move.attributes())
+
+    def penalty(self, move: Move) -> float:
+        """ Diversification penalty of a non improving move """
+        if self.diversification <= 0 or self.moves == 0:
+            return 0
+        frequency = sum(self.frequency[key] for key in move.attributes())
+        return self.diversification * frequency / self.moves
+
+    @staticmethod
+    def aspiration(value: float, best_objective: float) -> bool:
+        """ A tabu move is allowed if it improves the best solution found """
+        return value < best_objective
+
+
+class VisitedSolutions:
+    """ Bounded set of the hashes of the last visited solutions.
+
+    When the capacity is reached the least recently visited hash is dropped.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.hashes = OrderedDict()
+
+    def __contains__(self, h: int) -> bool:
+        return h in self.hashes
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def clear(self) -> None:
+        self.hashes.clear()
+
+    def add(self, h: int) -> bool:
+        """ Add the hash of a visited solution, return True if it was already visited """
+        if h in self.hashes:
+            self.hashes.move_to_end(h)
+            return True
+        self.hashes[h] = None
+        if len(self.hashes) > self.capacity:
+            self.hashes.popitem(last=False)
+        return False
@@ -0,0 +1,46 @@
+import contextlib
+import io
+import os
+import random
+import sys
+
+import pytest
+from sortedcontainers import SortedList
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from data import Instance, BusLeg
+from algorithm import ConstructionAlgorithm
+
+
+def make_instance(tours: int = 12, legs_per_tour: int = 5, positions: int = 4, seed: int = 1,
+                  config: Config = None) -> Instance:
+    """ Return a small random instance: tours of consecutive legs, with short passive rides between the positions """
+    rnd = random.Random(seed)
+    legs = SortedList()
+    for tour in range(1, tours + 1):
+        time = rnd.randint(300, 700)
+        position = rnd.randrange(positions)
+        for _ in range(legs_per_tour):
+            drive = rnd.randint(30, 90)
+            end_position = rnd.randrange(positions)
+            legs.add(BusLeg(len(legs) + 1, tour, time, time + drive, position, end_position))
+            time += drive + rnd.choice([0, 5, 10, 20, 40])
+            position = end_position
+    distance_matrix = [[0 if i == j else 5 + 3*abs(i - j) for j in range(positions)] for i in range(positions)]
+    return Instance(legs, distance_matrix, [10]*positions, [10]*positions, config)
+
+
+@pytest.fixture
+def instance() -> Instance:
+    return make_instance(config=Config(max_iter=5))
+
+
+@pytest.fixture
+def solution(instance):
+    """ Evaluated solution of the construction algorithm """
+    with contextlib.redirect_stdout(io.StringIO()):
+        solution = ConstructionAlgorithm(instance).apply()
+    solution.evaluate(instance)
+    return solution
@@ -0,0 +1,28 @@
+import contextlib
+import io
+
+from config import Config
+from grasp import GRASP
+from decomposition import Decomposition
+
+
+def test_derive_seed():
+    config = Config(seed=7)
+    assert config.derive_seed('subproblem', 1) == Config(seed=7).derive_seed('subproblem', 1)
+    assert config.derive_seed('subproblem', 1) != config.derive_seed('subproblem', 2)
+    assert config.derive_seed('TabuSearch') != Config(seed=8).derive_seed('TabuSearch')
+    assert Config().derive_seed('TabuSearch') is None
+
+
+def run(instance, workers, seed=7):
+    """ Return the shifts of GRASP and of the decomposition (two sub-instances) """
+    instance.config = Config(max_iter=3, seed=seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        grasp = [solution.shifts() for value, solution in GRASP(instance, constructions=4, workers=workers).apply()]
+        value, solution = Decomposition(instance, legs_per_subproblem=30, workers=workers).apply()
+    return grasp, solution.shifts()
+
+
+def test_results_do_not_depend_on_the_workers(instance):
+    assert run(instance, 2) == run(instance, 1)
+    assert run(instance, 1, seed=8) != run(instance, 1)
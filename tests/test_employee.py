@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from neighborhood import RelocateNeighborhood
+
+
+def changes(solution, count=300, seed=1):
+    """ Yield random (employee, legs_in, legs_out): legs of an other employee added, some of its own legs removed """
+    rnd = random.Random(seed)
+    employees = list(solution.employees.values())
+    for _ in range(count):
+        employee, other = rnd.sample(employees, 2)
+        legs = list(employee.bus_legs)
+        legs_out = rnd.sample(legs, rnd.randint(0, min(3, len(legs))))
+        legs_in = rnd.sample(list(other.bus_legs), rnd.randint(0, min(2, len(other.bus_legs))))
+        yield employee, legs_in, legs_out
+
+
+def apply(employee, legs_in, legs_out):
+    for leg in legs_out:
+        employee.bus_legs.remove(leg)
+    employee.bus_legs.update(legs_in)
+
+
+def undo(employee, legs_in, legs_out):
+    for leg in legs_in:
+        employee.bus_legs.remove(leg)
+    employee.bus_legs.update(legs_out)
+    employee.revert()
+
+
+def test_lower_bound_below_objective(solution):
+    for employee, legs_in, legs_out in changes(solution):
+        bound = employee.lower_bound(legs_in, legs_out)
+        apply(employee, legs_in, legs_out)
+        objective = employee.evaluate()
+        undo(employee, legs_in, legs_out)
+        assert bound <= objective
+
+
+@pytest.mark.parametrize('margin', [-200, 0, 200])
+def test_cutoff_evaluation(solution, margin):
+    for employee, legs_in, legs_out in changes(solution):
+        apply(employee, legs_in, legs_out)
+        objective = employee.evaluate()
+        employee.revert()
+        cutoff = objective + margin
+        cut = employee.evaluate(cutoff)
+        undo(employee, legs_in, legs_out)
+        if objective < cutoff:
+            assert cut == objective
+        else:
+            # Only a lower bound, but enough to reject the change
+            assert cutoff <= cut <= objective
+
+
+def test_cutoff_keeps_the_order_of_the_moves(solution):
+    moves = list(RelocateNeighborhood().moves(solution))[:150]
+    values = []
+    for move in moves:
+        values.append(move.execute(solution))
+        move.revert(solution)
+    cutoff = sorted(values)[len(values) // 4]
+    for move, value in zip(moves, values):
+        cut = move.execute(solution, cutoff)
+        move.revert(solution)
+        assert (cut < cutoff) == (value < cutoff)
+        if value < cutoff:
+            assert cut == value
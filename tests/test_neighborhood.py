@@ -0,0 +1,54 @@
+import copy
+
+import pytest
+
+from neighborhood import RelocateNeighborhood, SwapNeighborhood, BlockNeighborhood, TailExchangeNeighborhood
+
+NEIGHBORHOODS = [RelocateNeighborhood(), SwapNeighborhood(), BlockNeighborhood(min_length=1),
+                 TailExchangeNeighborhood()]
+
+
+def snapshot(solution):
+    return (solution.value, solution.hard, solution.soft, solution.feasible, solution.hash,
+            {key: [leg.id for leg in e.bus_legs] for key, e in solution.employees.items()},
+            {key: e.objective for key, e in solution.employees.items()})
+
+
+@pytest.mark.parametrize('neighborhood', NEIGHBORHOODS, ids=lambda n: n.name)
+def test_execute_revert_round_trip(solution, instance, neighborhood):
+    before = snapshot(solution)
+    moves = 0
+    for move in neighborhood.moves(solution):
+        value = move.execute(solution)
+        assert value == solution.value
+        assert solution.value == copy.deepcopy(solution).evaluate(instance)
+        move.revert(solution)
+        assert snapshot(solution) == before
+        moves += 1
+        if moves == 200:
+            break
+    assert moves > 0
+
+
+@pytest.mark.parametrize('neighborhood', NEIGHBORHOODS, ids=lambda n: n.name)
+def test_cut_move_is_reverted(solution, neighborhood):
+    before = snapshot(solution)
+    for move in list(neighborhood.moves(solution))[:100]:
+        move.execute(solution, cutoff=solution.value)
+        move.revert(solution)
+        assert snapshot(solution) == before
+
+
+def test_block_index_follows_the_moves(solution):
+    neighborhood = BlockNeighborhood(min_length=1)
+    for employee in solution.employees.values():
+        assert employee.blocks == employee.tour_blocks()
+    indexes = {key: e.blocks for key, e in solution.employees.items()}
+    for move in list(neighborhood.moves(solution))[:100]:
+        move.execute(solution)
+        for key in (move.i, move.j):
+            assert solution.employees[key].blocks == solution.employees[key].tour_blocks()
+        move.revert(solution)
+        # The index of the legs before the move is restored, not built again
+        assert solution.employees[move.i].blocks is indexes[move.i]
+        assert solution.employees[move.j].blocks is indexes[move.j]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+
+from service import JobService, HttpFrontEnd, instance_to_dict, instance_from_dict
+
+
+@pytest.fixture
+def data(instance):
+    data = instance_to_dict(instance)
+    data['config']['max_iter'] = 2
+    return data
+
+
+def malformed(data):
+    legs = data['legs']
+    return [
+        'not an object',
+        {'legs': legs},
+        {**data, 'start_work': data['start_work'][:-1]},
+        {**data, 'legs': [legs[0][:2]] + legs[1:]},
+        {**data, 'legs': [legs[0], legs[0]] + legs[2:]},
+        {**data, 'legs': [legs[0][:4] + [99, 0]] + legs[1:]},
+        {**data, 'config': {'unknown': 1}},
+        {**data, 'config': {'max_iter': 'many'}},
+        {**data, 'config': 3},
+    ]
+
+
+def test_instance_round_trip(instance, data):
+    copy = instance_from_dict(data)
+    assert [(leg.id, leg.start, leg.end) for leg in copy.legs] == [(leg.id, leg.start, leg.end) for leg in instance.legs]
+    assert copy.config.max_iter == 2
+
+
+def test_malformed_instances(data):
+    for bad in malformed(data):
+        with pytest.raises(ValueError):
+            instance_from_dict(bad)
+
+
+def test_environment_is_ignored(data, monkeypatch):
+    monkeypatch.setenv('BDS_MAX_ITER', '999')
+    assert instance_from_dict({**data, 'config': {}}).config.max_iter != 999
+
+
+async def http(port, raw):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(raw)
+    await writer.drain()
+    response = (await reader.read()).decode()
+    writer.close()
+    head, _, body = response.partition('\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_submit_list_cancel(data):
+    async def scenario():
+        async with JobService(workers=1, max_concurrent=1) as service:
+            for bad in malformed(data):
+                with pytest.raises(ValueError):
+                    await service.submit(bad)
+            with pytest.raises(ValueError):
+                await service.submit(data, max_iter=0)
+            assert service.list() == []
+
+            first = await service.submit(data)
+            second = await service.submit(data)
+            assert [job['id'] for job in service.list()] == [first, second]
+            # The second job waits for the only slot
+            assert service.cancel(second)
+            assert service.status(second)['status'] == 'cancelled'
+            info = await service.result(first)
+            assert info['status'] == 'done'
+            assert info['legs'] == len(data['legs'])
+            assert not service.cancel(first)
+            assert service.forget(first)
+            assert [job['id'] for job in service.list()] == [second]
+            with pytest.raises(KeyError):
+                service.status(first)
+    asyncio.run(scenario())
+
+
+def test_http_front_end(data):
+    async def scenario():
+        async with JobService(workers=1) as service:
+            front = HttpFrontEnd(service)
+            server = await asyncio.start_server(front.handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            for body in (b'{"instance": {"legs": []}}', b'not json', b'{"max_iter": 3}'):
+                code, content = await http(port, b'POST /jobs HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s'
+                                           % (len(body), body))
+                assert code == 400
+            code, content = await http(port, b'POST /jobs HTTP/1.1\r\nContent-Length: abc\r\n\r\n')
+            assert code == 400
+            body = json.dumps({'instance': data}).encode()
+            code, content = await http(port, b'POST /jobs HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s'
+                                       % (len(body), body))
+            assert code == 202
+            code, content = await http(port, f'GET /jobs/{content["id"]}/result HTTP/1.1\r\n\r\n'.encode())
+            assert code == 200 and content['status'] == 'done'
+            code, content = await http(port, b'GET /jobs HTTP/1.1\r\n\r\n')
+            assert code == 200 and len(content) == 1
+            code, content = await http(port, b'GET /jobs/42 HTTP/1.1\r\n\r\n')
+            assert code == 404
+            server.close()
+            await server.wait_closed()
+    asyncio.run(scenario())
@@ -0,0 +1,68 @@
+import contextlib
+import copy
+import io
+import random
+
+from algorithm import TabuSearch, ALNS
+from neighborhood import RelocateNeighborhood, SwapNeighborhood, BlockNeighborhood, TailExchangeNeighborhood
+
+NEIGHBORHOODS = [RelocateNeighborhood(), SwapNeighborhood(), BlockNeighborhood(min_length=1),
+                 TailExchangeNeighborhood()]
+
+
+def random_moves(solution, count, seed=1):
+    """ Yield random moves of the neighborhoods, the solution can be changed between two of them """
+    rnd = random.Random(seed)
+    for _ in range(count):
+        neighborhood = rnd.choice(NEIGHBORHOODS)
+        moves = list(neighborhood.moves(solution))
+        if moves:
+            yield rnd.choice(moves)
+
+
+def test_hash_after_moves(solution):
+    for move in random_moves(solution, 30):
+        expected = solution.hash ^ move.hash_delta()
+        move.execute(solution)
+        assert solution.hash == expected
+        assert solution.hash == solution.compute_hash()
+
+
+def test_hash_after_search(solution, instance):
+    with contextlib.redirect_stdout(io.StringIO()):
+        value, best = TabuSearch(instance, neighborhoods=NEIGHBORHOODS, max_iter=5).apply(solution)
+    assert best.hash == best.compute_hash()
+    assert solution.hash == solution.compute_hash()
+    with contextlib.redirect_stdout(io.StringIO()):
+        value, best = ALNS(instance, max_iter=30, seed=1).apply(solution)
+    assert best.hash == best.compute_hash()
+
+
+def totals(solution):
+    return (solution.value, solution.hard, solution.soft, solution.feasible,
+            {key: round(total, 6) for key, total in solution.constraint_totals.items() if round(total, 6)})
+
+
+def test_running_totals_match_a_full_evaluation(solution, instance):
+    for k, move in enumerate(random_moves(solution, 40)):
+        move.execute(solution)
+        if k % 3 == 0:
+            # Candidate moves, evaluated and rejected
+            for candidate in list(NEIGHBORHOODS[0].moves(solution))[:20]:
+                candidate.execute(solution, cutoff=solution.value)
+                candidate.revert(solution)
+        running = totals(solution)
+        assert running == totals(solution.copy())
+        full = copy.deepcopy(solution)
+        full.evaluate(instance)
+        assert running == totals(full)
+
+
+def test_running_totals_after_searches(solution, instance):
+    with contextlib.redirect_stdout(io.StringIO()):
+        tabu_value, tabu = TabuSearch(instance, neighborhoods=NEIGHBORHOODS, max_iter=5).apply(copy.deepcopy(solution))
+        alns_value, alns = ALNS(instance, max_iter=30, seed=1).apply(copy.deepcopy(solution))
+    for result in (tabu, alns):
+        running = totals(result)
+        result.evaluate(instance)
+        assert running == totals(result)
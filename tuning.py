@@ -0,0 +1,159 @@
+import argparse
+import contextlib
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+from config import Config
+from data import Instance
+from neighborhood import RelocateNeighborhood, SwapNeighborhood, BlockNeighborhood, TailExchangeNeighborhood
+from algorithm import ConstructionAlgorithm, TabuSearch
+
+
+NEIGHBORHOODS = {n.name: n for n in (RelocateNeighborhood, SwapNeighborhood, BlockNeighborhood,
+                                     TailExchangeNeighborhood)}
+
+
+def grid(tabu_length: Sequence[int] = (None,), max_iter: Sequence[int] = (None,),
+         neighborhoods: Sequence[Tuple[str, ...]] = (('relocate',),),
+         max_cputime: Sequence[float] = (None,)) -> List[Dict]:
+    """ Return every combination of the given values
+        (None keeps the value of the instance config, and does not limit the time of the tabu search for max_cputime)
+    """
+    return [{'tabu_length': t, 'max_iter': m, 'max_cputime': c, 'neighborhoods': tuple(n)}
+            for t, m, c, n in itertools.product(tabu_length, max_iter, max_cputime, neighborhoods)]
+
+
+def size_classes(instances: List[Instance], bounds: Sequence[int] = (100, 250, 500)) -> Dict[str, List[Instance]]:
+    """ Group the instances by number of legs: '<=100', '<=250', '<=500', '>500' with the default bounds """
+    classes = {}
+    for instance in instances:
+        n = len(instance.legs)
+        name = next((f'<={b}' for b in bounds if n <= b), f'>{bounds[-1]}')
+        classes.setdefault(name, []).append(instance)
+    return classes
+
+
+def run_candidate(instance: Instance, candidate: Dict) -> Tuple[int, float]:
+    """ Solve an instance with ConstructionAlgorithm + TabuSearch set up by 'candidate'.
+
+    This is the job executed by the worker processes.
+    :return: the best value and the CPU time in seconds
+    """
+    changes = {k: candidate[k] for k in ('tabu_length', 'max_iter') if candidate.get(k) is not None}
+    instance = Instance(instance.legs, instance.distance_matrix, instance.start_work, instance.end_work,
+                        instance.config.replace(**changes))
+    neighborhoods = [NEIGHBORHOODS[name]() for name in candidate['neighborhoods']]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.process_time()
+        solution = ConstructionAlgorithm(instance).apply()
+        solution.evaluate(instance)
+        best_objective, best_solution = TabuSearch(instance, neighborhoods=neighborhoods,
+                                                   max_time=candidate.get('max_cputime')).apply(solution)
+        duration = time.process_time() - start
+    return best_solution.value, duration
+
+
+class Race:
+    """ Racing over parameter configurations (candidates).
+
+    The candidates still in the race are run on one more instance of the
+    class at every stage, in parallel worker processes. The gap of a run is
+    its distance to the best value found on the instance at that stage
+    (value / best - 1). After 'min_stages' stages, a candidate whose mean gap
+    exceeds the best mean gap by more than 'tolerance' is discarded, so most
+    of the budget goes to the promising candidates. The survivors reach
+    about the same quality, and the fastest of them is the best candidate.
+    """
+
+    def __init__(self, candidates: List[Dict], min_stages: int = 2, tolerance: float = 0.01,
+                 workers: int = None) -> None:
+        """
+        :param candidates: Parameter configurations (see grid)
+        :param min_stages: Number of instances run by every candidate before any elimination
+        :param tolerance:  Mean gap to the best candidate beyond which a candidate is discarded
+        :param workers:    Number of worker processes (number of CPUs by default, 1 runs in this process)
+        """
+        self.candidates = candidates
+        self.min_stages = min_stages
+        self.tolerance = tolerance
+        self.workers = workers
+
+    def run(self, instances: List[Instance]) -> Dict:
+        """ Race the candidates on the instances of one class
+
+        :return: the best candidate with its mean gap and time, and the number of runs
+        """
+        alive = list(range(len(self.candidates)))
+        gaps = {c: [] for c in alive}
+        times = {c: [] for c in alive}
+        runs = 0
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers != 1 else None
+        try:
+            for stage, instance in enumerate(instances, 1):
+                args = [(instance, self.candidates[c]) for c in alive]
+                if executor is None:
+                    results = [run_candidate(*a) for a in args]
+                else:
+                    results = list(executor.map(run_candidate, *zip(*args)))
+                runs += len(results)
+                best = min(value for value, duration in results)
+                for c, (value, duration) in zip(alive, results):
+                    gaps[c].append(value / best - 1 if best > 0 else 0)
+                    times[c].append(duration)
+                mean_gap = {c: sum(gaps[c]) / len(gaps[c]) for c in alive}
+                if stage >= self.min_stages and len(alive) > 1:
+                    threshold = min(mean_gap.values()) + self.tolerance
+                    alive = [c for c in alive if mean_gap[c] <= threshold]
+                print(f'  Stage {stage}: {len(instance.legs)} legs, {len(args)} runs, '
+                      f'{len(alive)} candidates left')
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        mean_gap = {c: sum(gaps[c]) / len(gaps[c]) for c in alive}
+        alive = [c for c in alive if mean_gap[c] <= min(mean_gap.values()) + self.tolerance]
+        best = min(alive, key=lambda c: (sum(times[c]) / len(times[c]), mean_gap[c]))
+        return {'candidate': self.candidates[best], 'gap': sum(gaps[best]) / len(gaps[best]),
+                'time': sum(times[best]) / len(times[best]), 'survivors': len(alive), 'runs': runs}
+
+    def apply(self, classes: Dict[str, List[Instance]]) -> Dict[str, Dict]:
+        print('\n*******************************')
+        print('*           TUNING            *')
+        print('*******************************')
+        print(f'Number of candidates = {len(self.candidates)}')
+        report = {}
+        for name, instances in classes.items():
+            print(f'Class {name}: {len(instances)} instances')
+            report[name] = self.run(instances)
+        print()
+        print(f'{"class":>8} {"tabu_length":>11} {"max_iter":>8} {"max_cputime":>11} {"gap":>7} {"time":>8}  '
+              f'neighborhoods')
+        for name, result in report.items():
+            c = result['candidate']
+            print(f'{name:>8} {str(c["tabu_length"]):>11} {str(c["max_iter"]):>8} {str(c["max_cputime"]):>11} '
+                  f'{result["gap"]:>7.2%} {result["time"]:>8.2f}  {",".join(c["neighborhoods"])}')
+        return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Racing tuning of the tabu search parameters')
+    parser.add_argument('instances', nargs='+', help='Instances as SIZE_NUMBER, e.g. 10_2')
+    parser.add_argument('--directory', default='busdriver_instances', help='Directory of the instances')
+    parser.add_argument('--tabu-length', type=int, nargs='+', default=[None])
+    parser.add_argument('--max-iter', type=int, nargs='+', default=[None])
+    parser.add_argument('--max-cputime', type=float, nargs='+', default=[None], help='Time budgets in seconds')
+    parser.add_argument('--neighborhoods', nargs='+', default=['relocate'],
+                        help=f'Comma separated neighborhoods among {", ".join(NEIGHBORHOODS)}, e.g. relocate,swap')
+    parser.add_argument('--min-stages', type=int, default=2)
+    parser.add_argument('--tolerance', type=float, default=0.01)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None, help='Seed of every run (BDS_SEED or random by default)')
+    args = parser.parse_args()
+    # The candidates are compared on the same random streams
+    config = Config.from_env(seed=args.seed).with_seed()
+    print(f'Seed = {config.seed}')
+    instances = [Instance.read_data(*name.split('_', 1), args.directory, config) for name in args.instances]
+    candidates = grid(args.tabu_length, args.max_iter, [n.split(',') for n in args.neighborhoods], args.max_cputime)
+    Race(candidates, args.min_stages, args.tolerance, args.workers).apply(size_classes(instances))